@@ -8,34 +8,76 @@ from slixmpp.plugins import BasePlugin, register_plugin
 class XSFVotingAdhoc(BasePlugin):
     name = 'xsf_voting_adhoc'
     description = 'XSF: Proxy voting plugin via Adhoc Commands'
-    dependencies = set(['xep_0004', 'xep_0050', 'xsf_voting'])
+    dependencies = set(['xep_0004', 'xep_0050', 'xsf_roster', 'xsf_voting'])
+
+    def plugin_init(self):
+        self._nodes = {}
+        self.xmpp.add_event_handler('xsf_ballot_opened', self._ballot_opened)
+        self.xmpp.add_event_handler('xsf_ballot_closed', self._ballot_closed)
+        self.xmpp.add_event_handler('xsf_ballot_reloaded', self._ballot_reloaded)
 
     def session_bind(self, event):
-        ballot = self.xmpp['xsf_voting'].get_ballot()
+        for name in self.xmpp['xsf_voting'].get_ballots():
+            self._add_ballot_commands(name)
+
+    def _ballot_opened(self, name):
+        if self.xmpp.session_bind_event.is_set():
+            self._add_ballot_commands(name)
+
+    def _ballot_closed(self, name):
+        self._del_commands([node for node, (ballot, _) in self._nodes.items() if ballot == name])
+
+    def _ballot_reloaded(self, name):
+        self._ballot_closed(name)
+        self._add_ballot_commands(name)
+
+    def _add_ballot_commands(self, name):
+        ballot = self.xmpp['xsf_voting'].get_ballot(name)
         for section in ballot['sections']:
-            self.xmpp['xep_0050'].add_command(node=section['title'],
-                                              name=section['title'],
+            node = '%s:%s' % (name, section['title'])
+            self._nodes[node] = (name, section['title'])
+            self.xmpp['xep_0050'].add_command(node=node,
+                                              name='%s: %s' % (name, section['title']),
                                               handler=self._start_voting)
+        self.xmpp.event('xsf_commands_changed')
+
+    def _del_commands(self, nodes):
+        # Removing single disco items leaves them behind in the item cache
+        # of the command list, so rebuild the list from the remaining
+        # commands instead.
+        adhoc = self.xmpp['xep_0050']
+        disco = self.xmpp['xep_0030']
+        jid = self.xmpp.boundjid.full
+        for node in nodes:
+            del self._nodes[node]
+            adhoc.commands.pop((jid, node), None)
+
+        disco.del_items(jid=jid, node=adhoc.stanza.Command.namespace)
+        for (item_jid, node), command in adhoc.commands.items():
+            if item_jid == jid:
+                disco.add_item(jid=item_jid, name=command[0],
+                               node=adhoc.stanza.Command.namespace,
+                               subnode=node, ijid=jid)
+        self.xmpp.event('xsf_commands_changed')
 
     def _start_voting(self, iq, session):
-        if iq['from'].bare not in self.xmpp.xsf_members:
+        if not self.xmpp['xsf_roster'].is_member(iq['from']):
             self.xmpp['xep_0050'].terminate_command(session)
             raise XMPPError('forbidden')
 
-        ballot = self.xmpp['xsf_voting'].get_ballot()
-        self.xmpp['xsf_voting'].get_session(iq['from'])
+        name, title = self._nodes[iq['command']['node']]
+        ballot = self.xmpp['xsf_voting'].get_ballot(name)
+        self.xmpp['xsf_voting'].get_session(iq['from'], ballot=name)
 
         form = self.xmpp['xep_0004'].stanza.Form()
         form['type'] = 'form'
-        form['title'] = 'XSF Elections: %s' % iq['command']['node']
+        form['title'] = 'XSF Elections: %s' % title
         form['instructions'] = ('By proceeding, you affirm that you wish to have your '
                                 'vote count as a proxy vote in the official meeting to '
                                 'be held on %s' % ballot['date'])
         session['ballot'] = ballot
-        for section in ballot['sections']:
-            if section['title'] == iq['command']['node']:
-                session['ballot_section'] = section
-                break
+        session['ballot_name'] = name
+        session['ballot_section'] = ballot.findSection(title)
         session['payload'] = form
         session['has_next'] = True
         if session['ballot_section']['limit']:
@@ -45,7 +87,7 @@ class XSFVotingAdhoc(BasePlugin):
         return session
 
     def _handle_voting(self, _iq, session):
-        self.xmpp['xsf_voting'].start_voting(session['from'])
+        self.xmpp['xsf_voting'].start_voting(session['from'], ballot=session['ballot_name'])
         section = session['ballot_section']
 
         form = self.xmpp['xep_0004'].stanza.Form()
@@ -66,7 +108,7 @@ class XSFVotingAdhoc(BasePlugin):
         return session
 
     def _handle_limited_voting(self, iq, session):
-        self.xmpp['xsf_voting'].start_voting(session['from'])
+        self.xmpp['xsf_voting'].start_voting(session['from'], ballot=session['ballot_name'])
         section = session['ballot_section']
 
         form = self.xmpp['xep_0004'].stanza.Form()
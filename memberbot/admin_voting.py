@@ -0,0 +1,259 @@
+import logging
+import math
+import os
+
+from slixmpp.exceptions import XMPPError
+from slixmpp.jid import JID
+from slixmpp.plugins import BasePlugin, register_plugin
+from slixmpp.xmlstream import ET
+
+log = logging.getLogger(__name__)
+
+
+class XSFVotingAdmin(BasePlugin):
+    name = 'xsf_voting_admin'
+    description = 'XSF: Proxy voting administration via Adhoc Commands'
+    dependencies = set(['xep_0004', 'xep_0050', 'xsf_announce', 'xsf_roster', 'xsf_voting'])
+
+    def session_bind(self, event):
+        self.xmpp['xep_0050'].add_command(
+            node='admin:tally',
+            name='Show Current Vote Tally',
+            handler=self._tally)
+        self.xmpp['xep_0050'].add_command(
+            node='admin:ballot:open',
+            name='Open Ballot',
+            handler=self._open_ballot)
+        self.xmpp['xep_0050'].add_command(
+            node='admin:ballot:close',
+            name='Close Ballot',
+            handler=self._close_ballot)
+        self.xmpp['xep_0050'].add_command(
+            node='admin:ballot:reload',
+            name='Reload Ballot',
+            handler=self._reload_ballot)
+        self.xmpp['xep_0050'].add_command(
+            node='admin:announce',
+            name='Announce Open Ballot',
+            handler=self._announce)
+        self.xmpp['xep_0050'].add_command(
+            node='admin:audit',
+            name='Show Ballot Audit Digest',
+            handler=self._audit)
+        self.xmpp.event('xsf_commands_changed')
+
+    def _tally(self, iq, session):
+        if not self.xmpp['xsf_roster'].is_admin(iq['from']):
+            raise XMPPError('forbidden')
+
+        voting = self.xmpp['xsf_voting']
+
+        form = self.xmpp['xep_0004'].stanza.Form()
+        form['type'] = 'result'
+        form['title'] = 'XSF Elections: Current Tally'
+        for name in voting.get_ballots():
+            if not voting.is_loaded(name):
+                form.add_field(var='ballot-%s' % name,
+                               ftype='fixed',
+                               value='%s: no votes yet.' % name)
+                continue
+            ballot = voting.get_ballot(name)
+            tally = voting.get_tally(name)
+            form.add_field(var='ballot-%s' % name,
+                           ftype='fixed',
+                           value='%s: %s completed ballots counted (quorum: %s).' % (
+                               name, voting.num_counted(name), voting.get_quorum(name)))
+            for i, section in enumerate(ballot['sections']):
+                title = section['title']
+                counts = tally.get(title, {})
+                lines = []
+                for item in section['items']:
+                    answers = counts.get(item['name'], {})
+                    if section['limit']:
+                        lines.append('%s: %s' % (item['name'], answers.get('yes', 0)))
+                    else:
+                        lines.append('%s: %s yes / %s no' % (item['name'],
+                                                             answers.get('yes', 0),
+                                                             answers.get('no', 0)))
+                form.add_field(var='ballot-%s-section-%s' % (name, i),
+                               ftype='text-multi',
+                               label=title,
+                               value='\n'.join(lines))
+
+        session['payload'] = form
+        session['has_next'] = False
+        return session
+
+    def _open_ballot(self, iq, session):
+        if not self.xmpp['xsf_roster'].is_admin(iq['from']):
+            raise XMPPError('forbidden')
+
+        form = self.xmpp['xep_0004'].stanza.Form()
+        form['type'] = 'form'
+        form['title'] = 'Open Ballot'
+        form['instructions'] = 'Enter the name of a ballot file in the data directory'
+        form.add_field(var='ballot', ftype='text-single', title='Ballot', desc='Ballot name', required=True)
+        form.add_field(var='quorum', ftype='text-single', title='Quorum',
+                       desc='Number of votes required for quorum (default: a third of all members)')
+
+        session['payload'] = form
+        session['has_next'] = False
+
+        def handle_result(form, session):
+            name = form['values']['ballot'].strip()
+            if not os.path.isfile(self.xmpp['xsf_voting'].ballot_path(name)):
+                raise XMPPError('item-not-found', text='No such ballot: %s' % name)
+            quorum = form['values'].get('quorum')
+            if quorum:
+                quorum = int(quorum)
+            else:
+                quorum = math.ceil(len(self.xmpp['xsf_roster'].get_members()) / 3)
+
+            self.xmpp['xsf_voting'].open_ballot(name, quorum)
+
+            session['payload'] = None
+            session['next'] = None
+            return session
+
+        session['next'] = handle_result
+        return session
+
+    def _close_ballot(self, iq, session):
+        if not self.xmpp['xsf_roster'].is_admin(iq['from']):
+            raise XMPPError('forbidden')
+
+        form = self.xmpp['xep_0004'].stanza.Form()
+        form['type'] = 'form'
+        form['title'] = 'Close Ballot'
+        form.add_field(var='ballot', ftype='list-single', title='Ballot', required=True)
+        for name in self.xmpp['xsf_voting'].get_ballots():
+            form.field['ballot'].add_option(value=name)
+
+        session['payload'] = form
+        session['has_next'] = False
+
+        def handle_result(form, session):
+            self.xmpp['xsf_voting'].close_ballot(form['values']['ballot'])
+
+            session['payload'] = None
+            session['next'] = None
+            return session
+
+        session['next'] = handle_result
+        return session
+
+    def _reload_ballot(self, iq, session):
+        if not self.xmpp['xsf_roster'].is_admin(iq['from']):
+            raise XMPPError('forbidden')
+
+        form = self.xmpp['xep_0004'].stanza.Form()
+        form['type'] = 'form'
+        form['title'] = 'Reload Ballot'
+        form.add_field(var='ballot', ftype='list-single', title='Ballot', required=True)
+        for name in self.xmpp['xsf_voting'].get_ballots():
+            form.field['ballot'].add_option(value=name)
+
+        session['payload'] = form
+        session['has_next'] = False
+
+        def handle_result(form, session):
+            name = form['values']['ballot']
+            try:
+                self.xmpp['xsf_voting'].reload_ballot(name)
+            except (OSError, ET.ParseError) as e:
+                log.error('Could not reload ballot %s: %s', name, e)
+                raise XMPPError('bad-request', text='Could not reload ballot: %s' % e)
+
+            session['payload'] = None
+            session['next'] = None
+            return session
+
+        session['next'] = handle_result
+        return session
+
+    def _announce(self, iq, session):
+        if not self.xmpp['xsf_roster'].is_admin(iq['from']):
+            raise XMPPError('forbidden')
+
+        form = self.xmpp['xep_0004'].stanza.Form()
+        form['type'] = 'form'
+        form['title'] = 'Announce Open Ballot'
+        form['instructions'] = 'Send every member a notice that voting is open'
+        form.add_field(var='ballot', ftype='list-single', title='Ballot', required=True)
+        for name in self.xmpp['xsf_voting'].get_ballots():
+            form.field['ballot'].add_option(value=name)
+        form.add_field(var='audience', ftype='list-single', title='Recipients',
+                       value='pending', required=True)
+        form.field['audience'].add_option(label='Members who have not voted yet', value='pending')
+        form.field['audience'].add_option(label='All members', value='all')
+
+        session['payload'] = form
+        session['has_next'] = False
+
+        def handle_result(form, session):
+            name = form['values']['ballot']
+            queued = self.xmpp['xsf_announce'].announce(name, form['values']['audience'])
+            sent, _ = self.xmpp['xsf_announce'].progress(name)
+
+            result = self.xmpp['xep_0004'].stanza.Form()
+            result['type'] = 'result'
+            result['title'] = 'Announce Open Ballot'
+            result['instructions'] = '%s members queued, %s already notified.' % (queued, sent)
+
+            session['payload'] = result
+            session['next'] = None
+            return session
+
+        session['next'] = handle_result
+        return session
+
+    def _audit(self, iq, session):
+        if not self.xmpp['xsf_roster'].is_admin(iq['from']):
+            raise XMPPError('forbidden')
+
+        form = self.xmpp['xep_0004'].stanza.Form()
+        form['type'] = 'form'
+        form['title'] = 'Show Ballot Audit Digest'
+        form['instructions'] = 'Enter a member JID to also get the proof that their ballot is included'
+        form.add_field(var='ballot', ftype='list-single', title='Ballot', required=True)
+        for name in self.xmpp['xsf_voting'].get_ballots():
+            form.field['ballot'].add_option(value=name)
+        form.add_field(var='jid', ftype='jid-single', title='JID', desc='XSF Member JID')
+
+        session['payload'] = form
+        session['has_next'] = False
+
+        def handle_result(form, session):
+            name = form['values']['ballot']
+            jid = form['values'].get('jid')
+            audit = self.xmpp['xsf_voting'].get_audit(name)
+
+            result = self.xmpp['xep_0004'].stanza.Form()
+            result['type'] = 'result'
+            result['title'] = 'Audit Digest: %s' % name
+            if not len(audit):
+                result['instructions'] = 'No ballots have been recorded yet.'
+            else:
+                result.add_field(var='root', ftype='text-single', label='Merkle root (SHA-256)',
+                                 value=audit.root().hex())
+                result.add_field(var='count', ftype='text-single', label='Ballots recorded',
+                                 value=str(len(audit)))
+            if jid:
+                jid = JID(jid).bare
+                if jid not in audit:
+                    raise XMPPError('item-not-found', text='No ballot recorded for %s' % jid)
+                result.add_field(var='leaf', ftype='text-single', label='Leaf of %s' % jid,
+                                 value=audit.leaf(jid).hex())
+                result.add_field(var='proof', ftype='text-multi', label='Inclusion proof (leaf to root)',
+                                 value='\n'.join('%s %s' % (side, node.hex())
+                                                 for side, node in audit.proof(jid)))
+
+            session['payload'] = result
+            session['next'] = None
+            return session
+
+        session['next'] = handle_result
+        return session
+
+
+register_plugin(XSFVotingAdmin)
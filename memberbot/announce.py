@@ -0,0 +1,176 @@
+import logging
+import os
+from collections import deque
+
+from slixmpp.plugins import BasePlugin, register_plugin
+
+from chat_voting import render
+
+log = logging.getLogger(__name__)
+
+
+class XSFAnnounce(BasePlugin):
+    """
+    Tell members that voting is open.
+
+    Notices are sent from a queue at no more than `rate` stanzas per
+    second, members who are online going first. Every member notified is
+    appended to a progress file, so an announcement interrupted by a
+    restart resumes where it stopped instead of starting over.
+    """
+
+    name = 'xsf_announce'
+    description = 'XSF: Paced voting announcements'
+    dependencies = set(['xsf_roster', 'xsf_voting'])
+    default_config = {
+        'data_dir': 'data',
+        'rate': 5,
+        'partition': None,
+        'progress_tag': '',
+    }
+
+    def plugin_init(self):
+        self._queue = deque()
+        self._queued = set()
+        self._pending = {}
+        self._audience = {}
+        self._sent = {}
+        self._timer = None
+        self.xmpp.add_event_handler('session_start', self._resume)
+
+    def plugin_end(self):
+        self.xmpp.del_event_handler('session_start', self._resume)
+        if self._timer:
+            self._timer.cancel()
+
+    def _path(self, ballot, kind):
+        return '%s/announce/%s%s.%s' % (self.data_dir, ballot, self.progress_tag, kind)
+
+    def _load_sent(self, ballot):
+        if ballot not in self._sent:
+            sent = set()
+            try:
+                with open(self._path(ballot, 'sent')) as sent_file:
+                    for jid in sent_file:
+                        jid = jid.strip()
+                        if jid:
+                            sent.add(jid)
+            except FileNotFoundError:
+                pass
+            self._sent[ballot] = sent
+        return self._sent[ballot]
+
+    def _is_online(self, jid):
+        roster = self.xmpp.client_roster
+        return roster.has_jid(jid) and bool(roster[jid].resources)
+
+    def announce(self, ballot, audience='pending'):
+        """
+        Queue the opening notice of a ballot for every member, or with an
+        audience of 'pending' only for members who have not voted yet.
+
+        Returns the number of members queued.
+        """
+        os.makedirs('%s/announce' % self.data_dir, exist_ok=True)
+        with open(self._path(ballot, 'job'), 'w') as job_file:
+            job_file.write(audience)
+        return self._enqueue(ballot, audience)
+
+    def progress(self, ballot):
+        """Return the number of members notified and still queued."""
+        return len(self._load_sent(ballot)), self._pending.get(ballot, 0)
+
+    def _resume(self, event):
+        for ballot in self.xmpp['xsf_voting'].get_ballots():
+            try:
+                with open(self._path(ballot, 'job')) as job_file:
+                    audience = job_file.read().strip()
+            except FileNotFoundError:
+                continue
+            queued = self._enqueue(ballot, audience)
+            log.info('Resuming announcement of %s: %s members left', ballot, queued)
+
+    def _enqueue(self, ballot, audience):
+        sent = self._load_sent(ballot)
+        voting = self.xmpp['xsf_voting']
+        self._audience[ballot] = audience
+
+        online = []
+        offline = []
+        for member in self.xmpp['xsf_roster'].get_members():
+            jid = member.bare
+            if jid in sent or (ballot, jid) in self._queued:
+                continue
+            if self.partition is not None and not self.partition(jid):
+                continue
+            if audience == 'pending' and voting.has_voted(jid, ballot):
+                continue
+            if self._is_online(jid):
+                online.append(jid)
+            else:
+                offline.append(jid)
+
+        for jid in online + offline:
+            self._queue.append((ballot, jid))
+            self._queued.add((ballot, jid))
+        self._pending[ballot] = self._pending.get(ballot, 0) + len(online) + len(offline)
+
+        if not self._pending[ballot]:
+            self._finish(ballot)
+        elif not self._timer:
+            self._timer = self.xmpp.loop.call_later(1, self._send_batch)
+        return len(online) + len(offline)
+
+    def _finish(self, ballot):
+        self._pending.pop(ballot, None)
+        try:
+            os.remove(self._path(ballot, 'job'))
+        except FileNotFoundError:
+            pass
+        log.info('Finished announcing %s', ballot)
+
+    def _send_batch(self):
+        voting = self.xmpp['xsf_voting']
+        budget = self.rate
+        try:
+            while budget and self._queue:
+                ballot, jid = self._queue.popleft()
+                self._queued.discard((ballot, jid))
+                self._pending[ballot] -= 1
+
+                if ballot in voting.get_ballots():
+                    try:
+                        if self._audience[ballot] != 'pending' or not voting.has_voted(jid, ballot):
+                            budget -= 1
+                            self._send(ballot, jid)
+                    except Exception:
+                        # One voter must not hold up the announcement for
+                        # everybody else.
+                        log.exception('Could not announce ballot %s to %s', ballot, jid)
+                if not self._pending[ballot]:
+                    self._finish(ballot)
+        finally:
+            if self._queue:
+                self._timer = self.xmpp.loop.call_later(1, self._send_batch)
+            else:
+                self._timer = None
+
+    def _send(self, ballot, jid):
+        data = self.xmpp['xsf_voting'].get_ballot(ballot)
+        parts = [render(self.xmpp, jid, 'elections', {'titles': [s['title'] for s in data['sections']]}),
+                 render(self.xmpp, jid, 'meeting_notice', {'date': data['date']}),
+                 render(self.xmpp, jid, 'start_hint', {})]
+
+        msg = self.xmpp.Message()
+        msg['to'] = jid
+        msg['type'] = 'chat'
+        msg['body'] = '\n\n'.join(text for text, _ in parts)
+        msg['html']['body'] = ''.join(html for _, html in parts)
+        msg.send()
+
+        self._sent[ballot].add(jid)
+        with open(self._path(ballot, 'sent'), 'a') as sent_file:
+            sent_file.write('%s\n' % jid)
+
+
+register_plugin(XSFAnnounce)
@@ -0,0 +1,104 @@
+import hashlib
+
+
+def leaf_hash(data):
+    return hashlib.sha256(b'\x00' + data).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def verify(leaf, proof, root):
+    """
+    Check that a leaf hash belongs to the tree with the given root, using
+    the sibling path returned by MerkleLog.proof().
+    """
+    node = leaf
+    for side, sibling in proof:
+        if side == 'left':
+            node = node_hash(sibling, node)
+        else:
+            node = node_hash(node, sibling)
+    return node == root
+
+
+class MerkleLog:
+    """
+    Merkle tree over the final ballots of a vote, one leaf per voter.
+
+    A voter keeps the leaf position they were first given, so recasting a
+    ballot only rehashes the path from that leaf to the root, and a proof
+    of inclusion is the list of siblings along the same path. A node
+    without a right sibling is carried up to the next level unchanged.
+    Leaves and inner nodes are hashed with different prefixes so that one
+    can not be passed off as the other.
+    """
+
+    def __init__(self):
+        self._positions = {}
+        self._levels = [[]]
+
+    def __len__(self):
+        return len(self._levels[0])
+
+    def __contains__(self, jid):
+        return str(jid) in self._positions
+
+    def set_leaf(self, jid, data):
+        """
+        Set the leaf of a voter to the hash of data, adding the voter if
+        needed. Returns True if the voter was added.
+        """
+        jid = str(jid)
+        added = jid not in self._positions
+        if added:
+            self._positions[jid] = len(self._levels[0])
+            self._levels[0].append(None)
+        index = self._positions[jid]
+        self._levels[0][index] = leaf_hash(data)
+        self._update(index)
+        return added
+
+    def _update(self, index):
+        level = 0
+        while len(self._levels[level]) > 1:
+            nodes = self._levels[level]
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+            parents = self._levels[level + 1]
+
+            left = index & ~1
+            if left + 1 < len(nodes):
+                node = node_hash(nodes[left], nodes[left + 1])
+            else:
+                node = nodes[left]
+            index //= 2
+            if index == len(parents):
+                parents.append(node)
+            else:
+                parents[index] = node
+            level += 1
+
+    def root(self):
+        if not self._levels[0]:
+            return None
+        return self._levels[-1][0]
+
+    def leaf(self, jid):
+        return self._levels[0][self._positions[str(jid)]]
+
+    def proof(self, jid):
+        """
+        Return the inclusion proof of a voter as a list of (side, hash)
+        pairs, from the leaf up, side telling whether the sibling hash goes
+        on the left or the right.
+        """
+        index = self._positions[str(jid)]
+        proof = []
+        for nodes in self._levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(nodes):
+                proof.append(('left' if sibling < index else 'right', nodes[sibling]))
+            index //= 2
+        return proof
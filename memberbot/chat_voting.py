@@ -1,5 +1,7 @@
 import random
 import logging
+import time
+from collections import OrderedDict
 
 from slixmpp.plugins import BasePlugin, register_plugin
 
@@ -9,11 +11,132 @@ log = logging.getLogger(__name__)
 class XSFVotingChat(BasePlugin):
     name = 'xsf_voting_chat'
     description = 'XSF: Proxy voting via chat sessions'
-    dependencies = set(['xsf_voting'])
+    dependencies = set(['xep_0030', 'xsf_voting'])
+    default_config = {
+        'prewarm_size': 512,
+        'prewarm_ttl': 300,
+        'dedup_size': 2048,
+        'dedup_window': 300,
+    }
 
     def plugin_init(self):
         self.xmpp.add_event_handler('message', self.on_message)
+        self.xmpp.add_event_handler('xsf_ballot_closed', self._ballot_closed)
+        self.xmpp.add_event_handler('xsf_ballot_reloaded', self._ballot_reloaded)
+        self.xmpp.add_event_handler('xsf_session_changed', self._session_changed)
         self.sessions = {}
+        self._warm_sessions = OrderedDict()
+        self._features = OrderedDict()
+        self._fetching = set()
+        self._seen = OrderedDict()
+        self.stats = {'messages': 0, 'duplicates': 0}
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.prewarm_size:
+            cache.popitem(last=False)
+
+    def prewarm(self, jid):
+        """
+        Fetch the stored sessions and the disco features of a voter in the
+        background, so their first message can be answered from memory.
+        """
+        self.xmpp.loop.call_soon(self._prewarm_sessions, jid)
+        self._prewarm_features(jid)
+
+    def _prewarm_features(self, jid):
+        if jid not in self._features and jid not in self._fetching:
+            self._fetching.add(jid)
+            self.xmpp.loop.create_task(self._fetch_features(jid))
+
+    def _prewarm_sessions(self, jid):
+        voting = self.xmpp['xsf_voting']
+        sessions = {}
+        for ballot in voting.get_ballots():
+            # Presence must not be what compiles a ballot nobody has used
+            # yet; its sessions are fetched on first use instead.
+            if voting.is_loaded(ballot):
+                sessions[ballot] = voting.get_session(jid, ballot=ballot)
+        self._remember(self._warm_sessions, jid.bare, (time.monotonic(), sessions))
+
+    def get_session(self, jid, ballot):
+        """
+        Return a voter's stored session, using the prewarmed copy if it is
+        recent enough. A prewarmed copy is only ever used once.
+        """
+        fetched, sessions = self._warm_sessions.pop(jid.bare, (0, {}))
+        if ballot in sessions and time.monotonic() - fetched < self.prewarm_ttl:
+            return sessions[ballot]
+        return self.xmpp['xsf_voting'].get_session(jid, ballot=ballot)
+
+    async def _fetch_features(self, jid):
+        try:
+            info = await self.xmpp['xep_0030'].get_info(jid, cached=True)
+        except Exception as e:
+            log.debug('Could not fetch disco#info of %s: %s', jid, e)
+            return
+        finally:
+            self._fetching.discard(jid)
+        self._remember(self._features, jid, set(info['disco_info']['features']))
+
+    def has_feature(self, jid, feature):
+        """
+        Check a feature of a voter's client from the prewarmed disco#info.
+        If it is not known yet it is fetched in the background, and the
+        feature is assumed to be missing for now.
+        """
+        features = self._features.get(jid)
+        if features is None:
+            self._prewarm_features(jid)
+            return False
+        return feature in features
+
+    def _session_changed(self, jid):
+        # A prewarmed copy must never be used once the stored one changed.
+        self._warm_sessions.pop(jid.bare, None)
+
+    def _ballot_closed(self, name):
+        for user, session in list(self.sessions.items()):
+            if session.ballot == name:
+                del self.sessions[user]
+
+    def _ballot_reloaded(self, name):
+        # Sessions in progress still refer to the old ballot, so end them;
+        # the voter's next message will offer to resume where they left off.
+        for user, session in list(self.sessions.items()):
+            if session.ballot == name:
+                session.send('ballot_reloaded')
+                del self.sessions[user]
+
+    def is_duplicate(self, msg):
+        """
+        Check whether a message was already seen recently, based on its
+        origin-id (XEP-0359) or, failing that, its stanza id.
+
+        Resends after a stream resumption or copies arriving through more
+        than one route would otherwise be fed to the voting session again.
+        """
+        origin_id = msg.xml.find('{urn:xmpp:sid:0}origin-id')
+        stanza_id = origin_id.get('id') if origin_id is not None else msg['id']
+        if not stanza_id:
+            return False
+
+        now = time.monotonic()
+        seen = self._seen
+        while seen:
+            key, when = next(iter(seen.items()))
+            if now - when < self.dedup_window:
+                break
+            del seen[key]
+
+        key = (msg['from'].bare, stanza_id)
+        if key in seen:
+            return True
+        seen[key] = now
+        if len(seen) > self.dedup_size:
+            seen.popitem(last=False)
+        return False
 
     def on_message(self, msg):
         user = msg['from']
@@ -24,13 +147,25 @@ class XSFVotingChat(BasePlugin):
             log.warn('Unknown user: %s', user)
             return
 
+        self.stats['messages'] += 1
+        if self.is_duplicate(msg):
+            self.stats['duplicates'] += 1
+            log.debug('Dropping duplicate message %s from %s', msg['id'], user)
+            return
+
         if user not in self.sessions:
             self.sessions[user] = VotingSession(self.xmpp, user)
         session = self.sessions[user]
         try:
             session.process(msg['body'], )
         except StopIteration:
-            pass
+            # The session is over, the next message starts a new one.
+            if self.sessions.get(user) is session:
+                del self.sessions[user]
+        except Exception:
+            log.exception('Voting session of %s failed', user)
+            if self.sessions.get(user) is session:
+                del self.sessions[user]
 
 
 register_plugin(XSFVotingChat)
@@ -41,6 +176,7 @@ class VotingSession(object):
     def __init__(self, xmpp, user):
         self.xmpp = xmpp
         self.user = user
+        self.ballot = None
         self._session = self._process()
         next(self._session)
 
@@ -61,13 +197,26 @@ class VotingSession(object):
 
         self.send('welcome')
 
-        ballot = self.xmpp['xsf_voting'].get_ballot()
+        ballots = self.xmpp['xsf_voting'].get_ballots()
 
-        if not ballot:
+        if not ballots:
             self.send('no_elections')
             return
+        elif len(ballots) == 1:
+            self.ballot = ballots[0]
         else:
-            self.send('elections', titles=[s['title'] for s in ballot['sections']])
+            self.send('choose_ballot', ballots=ballots)
+            options = [str(i + 1) for i, name in enumerate(ballots)]
+            choice = (yield)
+            choice = choice.strip()
+            while choice not in options and choice not in ballots:
+                self.send('invalid_ballot', max=len(options))
+                choice = (yield)
+                choice = choice.strip()
+            self.ballot = ballots[int(choice) - 1] if choice in options else choice
+
+        ballot = self.xmpp['xsf_voting'].get_ballot(self.ballot)
+        self.send('elections', titles=[s['title'] for s in ballot['sections']])
 
         self.send('meeting_notice', date=ballot['date'])
 
@@ -75,7 +224,7 @@ class VotingSession(object):
         # Setup the voting session, based on any previous sessions from this election.
         # ----------------------------------------------------------------------------
 
-        session = self.xmpp['xsf_voting'].get_session(self.user)
+        session = self.xmpp['xsf_voting_chat'].get_session(self.user, self.ballot)
         if session['status'] == 'completed':
             self.send('already_voted')
             vote = (yield)
@@ -87,7 +236,7 @@ class VotingSession(object):
             if vote == 'no':
                 self.end()
                 return
-            session = self.xmpp['xsf_voting'].restart_voting(self.user)
+            session = self.xmpp['xsf_voting'].restart_voting(self.user, ballot=self.ballot)
         elif session['status'] == 'started':
             self.send('resume_voting')
             vote = (yield)
@@ -110,7 +259,7 @@ class VotingSession(object):
             if vote == 'no':
                 self.end()
                 return
-            session = self.xmpp['xsf_voting'].start_voting(self.user)
+            session = self.xmpp['xsf_voting'].start_voting(self.user, ballot=self.ballot)
 
         # ----------------------------------------------------------------------------
         # Collect votes for each ballot section.
@@ -156,7 +305,7 @@ class VotingSession(object):
 
                 for i in range(0, min(int(section['limit']), len(items))):
                     if abstain:
-                        session = self.xmpp['xsf_voting'].abstain_vote(self.user, title, str(i + 1))
+                        session = self.xmpp['xsf_voting'].abstain_vote(self.user, title, str(i + 1), ballot=self.ballot)
                         break
 
                     self.send('limited_choice',
@@ -177,13 +326,13 @@ class VotingSession(object):
                         vote = vote.strip().lower()
                     if vote in ('0', 'none'):
                         abstain = True
-                        session = self.xmpp['xsf_voting'].abstain_vote(self.user, title, str(i + 1))
+                        session = self.xmpp['xsf_voting'].abstain_vote(self.user, title, str(i + 1), ballot=self.ballot)
                         self.send('abstain')
                     else:
                         name = items[int(vote) - 1]['name']
                         self.send('chosen_limited_candidate', name=name)
                         selections.add(vote)
-                        session = self.xmpp['xsf_voting'].record_vote(self.user, title, str(i + 1), name)
+                        session = self.xmpp['xsf_voting'].record_vote(self.user, title, str(i + 1), name, ballot=self.ballot)
             else:
                 # --------------------------------------------------------------------
                 # XSF Membership Elections
@@ -204,7 +353,8 @@ class VotingSession(object):
                         self.send('invalid_yesno')
                         vote = (yield)
                         vote = vote.strip().lower()
-                    session = self.xmpp['xsf_voting'].record_vote(self.user, section['title'], item['name'], vote)
+                    session = self.xmpp['xsf_voting'].record_vote(self.user, section['title'], item['name'], vote,
+                                                                  ballot=self.ballot)
 
         # ----------------------------------------------------------------------------
         # Display final results
@@ -214,144 +364,11 @@ class VotingSession(object):
             if not votes:
                 self.send('no_vote_results')
 
-        self.xmpp['xsf_voting'].end_voting(self.user)
+        self.xmpp['xsf_voting'].end_voting(self.user, ballot=self.ballot)
         self.end()
 
     def send(self, template, **data):
-        text = ''
-        html = ''
-
-        if template == 'welcome':
-            name = self.xmpp.client_roster[self.user]['name'] or self.user.bare
-            text = 'Hi, %s!' % name
-        elif template == 'end':
-            name = self.xmpp.client_roster[self.user]['name'] or self.user.bare
-            text = 'Thank you for voting, %s! If you wish to recast your votes later, just start a new voting session.' % name
-            data['chat_state'] = 'gone'
-        elif template == 'no_elections':
-            text = 'No elections are being held at this time.'
-        elif template == 'elections':
-            titles = data['titles']
-            text = 'Voting has begun for: %s' % ', '.join(titles)
-            titles = ['<strong>%s</strong>' % title for title in titles]
-            html = '<p>Voting has begun for: %s</p>' % ', '.join(titles)
-        elif template == 'meeting_notice':
-            text = ('By proceeding, you affirm that you wish to have your'
-                    ' vote count as a proxy vote in the official meeting'
-                    ' to be held on %s in xsf@muc.xmpp.org.')
-            html = ('<p><em>By proceeding, you affirm that you wish to have'
-                    ' your vote count as a proxy vote in the official'
-                    ' meeting to be held on <strong>%s</strong> in'
-                    ' <a href="xmpp:xsf@muc.xmpp.org?join">xsf@muc.xmpp.org</a>.</em></p>')
-            text = text % data['date']
-            html = html % data['date']
-        elif template == 'invalid_yesno':
-            text = 'Please respond with "yes" or "no".'
-            html = '<p>Please respond with <strong>yes</strong> or <strong>no</strong>.</p>'
-        elif template == 'already_voted':
-            text = ('You have already participated in this election.'
-                    ' Would you like to recast your votes? (yes/no)')
-            html = ('<p>You have already participated in this election.'
-                    ' Would you like to recast your votes? ('
-                    '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
-                    ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
-            html = html.format(self.xmpp.boundjid)
-        elif template == 'resume_voting':
-            text = ('You started voting, but have not finished.'
-                    ' Would you like to resume voting? (yes/no)')
-            html = ('<p>You started voting, but have not finished.'
-                    ' Would you like to resume voting? ('
-                    '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
-                    ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
-            html = html.format(self.xmpp.boundjid)
-        elif template == 'start_voting':
-            text = 'Would you like to cast your votes now? (yes/no)'
-            html = ('<p>Would you like to cast your votes now? ('
-                    '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
-                    ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
-            html = html.format(self.xmpp.boundjid)
-        elif template == 'approve_candidate':
-            text = 'Approve? (yes/no)'
-            html = ('<p>Approve? ('
-                    '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
-                    ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
-            html = html.format(self.xmpp.boundjid)
-        elif template == 'ballot_section':
-            text = '%s:' % data['title']
-            html = '<p><strong>%s</strong>:</p>' % data['title']
-        elif template == 'num_candidates_limited':
-            text = 'There are {candidates} candidates. You may vote for up to {limit}.'
-            html = '<p><em>There are {candidates} candidates. You may vote for up to {limit}.</em></p>'
-
-            text = text.format(**data)
-            html = html.format(**data)
-        elif template == 'limited_candidate':
-            text = '{index}) {name} ({jid}) -- {url}'.format(**data)
-            html = ('<p>{index}) <strong><a href="xmpp:{jid}?message">{name}</a></strong>'
-                    ' (<a href="{url}">View application</a>)</p>')
-            html = html.format(**data)
-        elif template == 'previous_limited_votes':
-            text = 'You previously voted for:'
-            html = '<p><em>You previously voted for:</em></p>'
-        elif template == 'previous_limited_candidate':
-            text = '- %s' % data['candidate']
-            html = '<p><em>- %s</em></p>' % data['candidate']
-        elif template == 'limited_choice':
-            text = 'Choice {index} for {title}: ({formatted_options}), or 0 to abstain'
-            opts = []
-            for option in data['options']:
-                if option not in data['selections']:
-                    opts.append(option)
-            data['formatted_options'] = ' / '.join(opts)
-            text = text.format(**data)
-
-            html = '<p>Choice {index} for <strong>{title}</strong>: {formatted_options}, or 0 to abstain</p>'
-            opts = []
-            for option in data['options']:
-                if option in data['selections']:
-                    continue
-                index = int(option) - 1
-                name = data['names'][index]
-                opt = '%s) <a href="xmpp:%s?message;type=chat;body=%s">%s</a>'
-                opts.append(opt % (option, self.xmpp.boundjid, option, name))
-            data['formatted_options'] = ' / '.join(opts)
-            html = html.format(**data)
-        elif template == 'invalid_index':
-            text = ('Please respond with the number (1 through %s) of the'
-                    ' candidate you wish to select (or 0 to abstain).') % data['max']
-        elif template == 'duplicate_index':
-            text = ('You have already chosen {index} ({name}).'
-                    ' Please select another candidate.').format(**data)
-        elif template == 'chosen_limited_candidate':
-            text = 'You chose %s.' % data['name']
-            html = '<p><em>You chose %s.</em></p>' % data['name']
-        elif template == 'num_candidates':
-            text = 'There are %s matters subject to vote.' % data['candidates']
-            html = '<p><em>There are %s matters subject to vote.</em></p>' % data['candidates']
-        elif template == 'candidate':
-            if (data['jid']):
-                text = '{name} ({jid}) -- {url}'.format(**data)
-                html = ('<p><strong><a href="xmpp:{jid}?message">{name}</a></strong>'
-                        ' (<a href="{url}">More information</a>)</p>').format(**data)
-            else:
-                text = '{name} -- {url}'.format(**data)
-                html = ('<p><strong>{name}</strong> '
-                        ' (<a href="{url}">More information</a>)</p>').format(**data)
-        elif template == 'previous_vote':
-            text = 'You previously voted {vote} for: {name}.'.format(**data)
-            html = ('<p><em>You previously voted <strong>{vote}</strong>'
-                    ' for: <strong>{name}</strong></em></p>').format(**data)
-        elif template == 'vote_results':
-            votes = '\n'.join(f'{name} -- {vote}' for name, vote in data['votes'])
-            text = 'Your votes for %s:\n%s' % (data['title'], votes)
-            votes = ''.join(f'<li><strong>{name}</strong> - <em>{vote}</em></li>' for name, vote in data['votes'])
-            html = '<p>Your votes for <strong>%s</strong>:</p><ul>%s</ul>' % (data['title'], votes)
-        elif template == 'no_vote_results':
-            text = 'You abstained from all choices for this topic'
-            html = '<p>You abstained from all choices for this topic</p>'
-        elif template == 'abstain':
-            text = 'You have abstained from further votes for this topic.'
-            html = '<p>You have abstained from further votes for this topic.</p>'
+        text, html = render(self.xmpp, self.user, template, data)
 
         reply = self.xmpp.Message()
         reply['to'] = self.user
@@ -364,5 +381,168 @@ class VotingSession(object):
         reply.send()
 
     def has_feature(self, feature: str) -> bool:
-        info = yield from self.xmpp['xep_0030'].get_info(self.user, cached=True)
-        return feature in info['features']
+        return self.xmpp['xsf_voting_chat'].has_feature(self.user, feature)
+
+
+def render(xmpp, user, template, data):
+    """
+    Return the plain text and XHTML-IM bodies of a message template.
+    """
+    text = ''
+    html = ''
+
+    if template == 'welcome':
+        name = xmpp.client_roster[user]['name'] or user.bare
+        text = 'Hi, %s!' % name
+    elif template == 'end':
+        name = xmpp.client_roster[user]['name'] or user.bare
+        text = 'Thank you for voting, %s! If you wish to recast your votes later, just start a new voting session.' % name
+        data['chat_state'] = 'gone'
+    elif template == 'no_elections':
+        text = 'No elections are being held at this time.'
+    elif template == 'choose_ballot':
+        text = 'Several ballots are open. Which one would you like to vote on?\n%s'
+        text = text % '\n'.join('%s) %s' % (i + 1, name) for i, name in enumerate(data['ballots']))
+        html = '<p>Several ballots are open. Which one would you like to vote on?</p><ul>%s</ul>'
+        opt = '<li>%s) <a href="xmpp:%s?message;type=chat;body=%s">%s</a></li>'
+        html = html % ''.join(opt % (i + 1, xmpp.boundjid, i + 1, name)
+                              for i, name in enumerate(data['ballots']))
+    elif template == 'invalid_ballot':
+        text = ('Please respond with the number (1 through %s) or the name'
+                ' of the ballot you wish to vote on.') % data['max']
+    elif template == 'ballot_reloaded':
+        text = ('The ballot has just been updated. Your votes so far have'
+                ' been saved; send any message to resume voting.')
+        html = ('<p>The ballot has just been updated. Your votes so far have'
+                ' been saved; send any message to resume voting.</p>')
+    elif template == 'wrong_worker':
+        text = 'Votes are not taken at this address. Please send your messages to %s instead.' % data['owner']
+        html = ('<p>Votes are not taken at this address. Please send your messages to'
+                ' <a href="xmpp:%s?message">%s</a> instead.</p>') % (data['owner'], data['owner'])
+    elif template == 'elections':
+        titles = data['titles']
+        text = 'Voting has begun for: %s' % ', '.join(titles)
+        titles = ['<strong>%s</strong>' % title for title in titles]
+        html = '<p>Voting has begun for: %s</p>' % ', '.join(titles)
+    elif template == 'start_hint':
+        text = 'Send me any message to cast your votes.'
+        html = '<p>Send me any message to cast your votes.</p>'
+    elif template == 'meeting_notice':
+        text = ('By proceeding, you affirm that you wish to have your'
+                ' vote count as a proxy vote in the official meeting'
+                ' to be held on %s in xsf@muc.xmpp.org.')
+        html = ('<p><em>By proceeding, you affirm that you wish to have'
+                ' your vote count as a proxy vote in the official'
+                ' meeting to be held on <strong>%s</strong> in'
+                ' <a href="xmpp:xsf@muc.xmpp.org?join">xsf@muc.xmpp.org</a>.</em></p>')
+        text = text % data['date']
+        html = html % data['date']
+    elif template == 'invalid_yesno':
+        text = 'Please respond with "yes" or "no".'
+        html = '<p>Please respond with <strong>yes</strong> or <strong>no</strong>.</p>'
+    elif template == 'already_voted':
+        text = ('You have already participated in this election.'
+                ' Would you like to recast your votes? (yes/no)')
+        html = ('<p>You have already participated in this election.'
+                ' Would you like to recast your votes? ('
+                '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
+                ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
+        html = html.format(xmpp.boundjid)
+    elif template == 'resume_voting':
+        text = ('You started voting, but have not finished.'
+                ' Would you like to resume voting? (yes/no)')
+        html = ('<p>You started voting, but have not finished.'
+                ' Would you like to resume voting? ('
+                '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
+                ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
+        html = html.format(xmpp.boundjid)
+    elif template == 'start_voting':
+        text = 'Would you like to cast your votes now? (yes/no)'
+        html = ('<p>Would you like to cast your votes now? ('
+                '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
+                ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
+        html = html.format(xmpp.boundjid)
+    elif template == 'approve_candidate':
+        text = 'Approve? (yes/no)'
+        html = ('<p>Approve? ('
+                '<a href="xmpp:{0}?message;type=chat;body=yes">yes</a> /'
+                ' <a href="xmpp:{0}?message;type=chat;body=no">no</a>)</p>')
+        html = html.format(xmpp.boundjid)
+    elif template == 'ballot_section':
+        text = '%s:' % data['title']
+        html = '<p><strong>%s</strong>:</p>' % data['title']
+    elif template == 'num_candidates_limited':
+        text = 'There are {candidates} candidates. You may vote for up to {limit}.'
+        html = '<p><em>There are {candidates} candidates. You may vote for up to {limit}.</em></p>'
+
+        text = text.format(**data)
+        html = html.format(**data)
+    elif template == 'limited_candidate':
+        text = '{index}) {name} ({jid}) -- {url}'.format(**data)
+        html = ('<p>{index}) <strong><a href="xmpp:{jid}?message">{name}</a></strong>'
+                ' (<a href="{url}">View application</a>)</p>')
+        html = html.format(**data)
+    elif template == 'previous_limited_votes':
+        text = 'You previously voted for:'
+        html = '<p><em>You previously voted for:</em></p>'
+    elif template == 'previous_limited_candidate':
+        text = '- %s' % data['candidate']
+        html = '<p><em>- %s</em></p>' % data['candidate']
+    elif template == 'limited_choice':
+        text = 'Choice {index} for {title}: ({formatted_options}), or 0 to abstain'
+        opts = []
+        for option in data['options']:
+            if option not in data['selections']:
+                opts.append(option)
+        data['formatted_options'] = ' / '.join(opts)
+        text = text.format(**data)
+
+        html = '<p>Choice {index} for <strong>{title}</strong>: {formatted_options}, or 0 to abstain</p>'
+        opts = []
+        for option in data['options']:
+            if option in data['selections']:
+                continue
+            index = int(option) - 1
+            name = data['names'][index]
+            opt = '%s) <a href="xmpp:%s?message;type=chat;body=%s">%s</a>'
+            opts.append(opt % (option, xmpp.boundjid, option, name))
+        data['formatted_options'] = ' / '.join(opts)
+        html = html.format(**data)
+    elif template == 'invalid_index':
+        text = ('Please respond with the number (1 through %s) of the'
+                ' candidate you wish to select (or 0 to abstain).') % data['max']
+    elif template == 'duplicate_index':
+        text = ('You have already chosen {index} ({name}).'
+                ' Please select another candidate.').format(**data)
+    elif template == 'chosen_limited_candidate':
+        text = 'You chose %s.' % data['name']
+        html = '<p><em>You chose %s.</em></p>' % data['name']
+    elif template == 'num_candidates':
+        text = 'There are %s matters subject to vote.' % data['candidates']
+        html = '<p><em>There are %s matters subject to vote.</em></p>' % data['candidates']
+    elif template == 'candidate':
+        if (data['jid']):
+            text = '{name} ({jid}) -- {url}'.format(**data)
+            html = ('<p><strong><a href="xmpp:{jid}?message">{name}</a></strong>'
+                    ' (<a href="{url}">More information</a>)</p>').format(**data)
+        else:
+            text = '{name} -- {url}'.format(**data)
+            html = ('<p><strong>{name}</strong> '
+                    ' (<a href="{url}">More information</a>)</p>').format(**data)
+    elif template == 'previous_vote':
+        text = 'You previously voted {vote} for: {name}.'.format(**data)
+        html = ('<p><em>You previously voted <strong>{vote}</strong>'
+                ' for: <strong>{name}</strong></em></p>').format(**data)
+    elif template == 'vote_results':
+        votes = '\n'.join(f'{name} -- {vote}' for name, vote in data['votes'])
+        text = 'Your votes for %s:\n%s' % (data['title'], votes)
+        votes = ''.join(f'<li><strong>{name}</strong> - <em>{vote}</em></li>' for name, vote in data['votes'])
+        html = '<p>Your votes for <strong>%s</strong>:</p><ul>%s</ul>' % (data['title'], votes)
+    elif template == 'no_vote_results':
+        text = 'You abstained from all choices for this topic'
+        html = '<p>You abstained from all choices for this topic</p>'
+    elif template == 'abstain':
+        text = 'You have abstained from further votes for this topic.'
+        html = '<p>You have abstained from further votes for this topic.</p>'
+
+    return text, html
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Run the XSF voting plugins as an external component (XEP-0114).
+
+Several workers may be started with the same --worker-jids list, each
+connecting as its own JID from that list (servers deliver a stanza to a
+single component connection, so workers cannot share one JID). Voters are
+assigned to workers by consistent hashing of their bare JID, and a worker
+receiving a stanza from a voter it does not own points them to the right
+worker: messages get a chat reply naming it, and iq requests a redirect
+error. Sessions are kept in a shared Redis server so that quorum and voter
+state are the same for all of them.
+
+For testing, point --server/--port at a local XMPP server accepting
+component connections for the given JID and secret, or at fake_server.py,
+which prints what the workers send and delivers stanzas typed on its
+standard input.
+"""
+import logging
+import getpass
+import math
+import slixmpp
+
+from optparse import OptionParser
+
+import xsf_roster
+import voting
+import admin_voting
+import announce
+import chat_voting
+import logutil
+from chat_voting import render
+from partition import HashRing
+
+log = logging.getLogger(__name__)
+
+
+class MemberBotComponent(slixmpp.ComponentXMPP):
+
+    def __init__(self, jid, secret, server, port, ballots,
+                 worker=0, workers=1, storage='redis', plugin_config=None,
+                 worker_jids=None):
+        super(MemberBotComponent, self).__init__(jid, secret, server, port,
+                                                 plugin_config=plugin_config)
+
+        self.worker = worker
+        self.worker_jids = worker_jids or []
+        self.ring = HashRing(workers)
+
+        self.auto_authorize = None
+        self.auto_subscribe = None
+
+        self.register_plugin('xep_0030')
+        self.register_plugin('xep_0050')
+        self.register_plugin('xep_0071')
+        self.register_plugin('xep_0085')
+        self.register_plugin('xep_0092')
+        self.register_plugin('xep_0199')
+
+        self['xep_0092'].software_name = 'XSF Memberbot'
+        self['xep_0092'].version = '2.0'
+
+        self.add_event_handler('session_start', self.session_start)
+        self.add_event_handler('roster_subscription_request',
+                               self.roster_subscription_request)
+        self.add_event_handler('presence_available', self.presence_available)
+        self.add_filter('in', self.partition_filter)
+        self.add_filter('out', self.set_sender)
+
+        self.register_plugin('xsf_roster')
+        self.register_plugin('xsf_voting', {'storage': storage})
+        self.register_plugin('xsf_voting_chat')
+        self.register_plugin('xsf_announce', {'partition': self.owns,
+                                              'progress_tag': '-%s' % worker})
+        self.register_plugin('xsf_voting_admin')
+
+        quorum = math.ceil(len(self['xsf_roster'].get_members()) / 3)
+        for ballot in ballots:
+            self['xsf_voting'].open_ballot(ballot, quorum)
+
+    def owns(self, jid):
+        return self.ring.owner(jid) == self.worker
+
+    def owner_jid(self, jid):
+        """Return the JID of the worker owning a voter, if it is known."""
+        owner = self.ring.owner(jid)
+        if owner < len(self.worker_jids):
+            return self.worker_jids[owner]
+        return None
+
+    def partition_filter(self, stanza):
+        # Stanzas from members belong to the worker owning that member;
+        # everything else (server replies, non-members) is handled as usual.
+        if stanza.name in ('message', 'presence', 'iq'):
+            sender = stanza['from']
+            if sender and self['xsf_roster'].is_member(sender) and not self.owns(sender):
+                self.redirect(stanza)
+                return None
+        return stanza
+
+    def redirect(self, stanza):
+        """Point a voter who wrote to the wrong worker to the right one."""
+        owner = self.owner_jid(stanza['from'])
+        if stanza.name == 'iq' and stanza['type'] in ('get', 'set'):
+            reply = self.Iq(sto=stanza['from'], sfrom=stanza['to'], stype='error')
+            reply['id'] = stanza['id']
+            if owner:
+                reply['error']['type'] = 'modify'
+                reply['error']['condition'] = 'redirect'
+                condition = reply['error'].xml.find('{%s}redirect' % reply['error'].condition_ns)
+                condition.text = 'xmpp:%s' % owner
+            else:
+                reply['error']['type'] = 'cancel'
+                reply['error']['condition'] = 'service-unavailable'
+            reply.send()
+        elif stanza.name == 'message' and stanza['type'] in ('normal', 'chat') and stanza['body']:
+            if owner:
+                text, html = render(self, stanza['from'], 'wrong_worker', {'owner': owner})
+                msg = self.Message(sto=stanza['from'], sfrom=stanza['to'], stype='chat')
+                msg['body'] = text
+                msg['html']['body'] = html
+            else:
+                msg = self.Message(sto=stanza['from'], sfrom=stanza['to'], stype='error')
+                msg['id'] = stanza['id']
+                msg['error']['type'] = 'cancel'
+                msg['error']['condition'] = 'service-unavailable'
+            msg.send()
+        log.debug('Redirected %s from %s to worker %s', stanza.name, stanza['from'], owner)
+
+    def set_sender(self, stanza):
+        # The plugins address replies like a client would; a component has
+        # to say which of its JIDs a stanza comes from.
+        if isinstance(stanza, slixmpp.ElementBase) and 'from' in stanza.interfaces and not stanza['from']:
+            stanza['from'] = self.boundjid
+        return stanza
+
+    def session_start(self, event):
+        log.info('Worker %s of %s ready as %s', self.worker, self.ring.workers, self.boundjid)
+
+    def roster_subscription_request(self, pres):
+        if self['xsf_roster'].is_member(pres['from']):
+            self.send_presence(pto=pres['from'], pfrom=self.boundjid.bare, ptype='subscribed')
+            self.send_presence(pto=pres['from'], pfrom=self.boundjid.bare)
+        else:
+            self.send_presence(pto=pres['from'], pfrom=self.boundjid.bare, ptype='unsubscribed')
+
+    def presence_available(self, pres):
+        if self['xsf_roster'].is_member(pres['from']):
+            self['xsf_voting_chat'].prewarm(pres['from'])
+
+
+if __name__ == '__main__':
+    optp = OptionParser()
+
+    optp.add_option('-q', '--quiet', help='set logging to ERROR',
+                    action='store_const', dest='loglevel',
+                    const=logging.ERROR, default=logging.INFO)
+    optp.add_option('-d', '--debug', help='set logging to DEBUG',
+                    action='store_const', dest='loglevel',
+                    const=logging.DEBUG, default=logging.INFO)
+    optp.add_option('-l', '--log-level', dest='log_levels', action='append',
+                    metavar='LOGGER=LEVEL',
+                    help='set the level of a single logger (may be repeated)')
+
+    optp.add_option("-j", "--jid", dest="jid",
+                    help="component JID")
+    optp.add_option("-s", "--secret", dest="secret",
+                    help="component secret")
+    optp.add_option("--server", dest="server", default='localhost',
+                    help="host of the server accepting the component")
+    optp.add_option("--port", dest="port", type='int', default=5347,
+                    help="component port of the server")
+    optp.add_option("-b", "--ballot", dest="ballots", action="append",
+                    help="name of a ballot to open (may be repeated)")
+    optp.add_option("--worker", dest="worker", type='int', default=0,
+                    help="number of this worker, starting at 0")
+    optp.add_option("--workers", dest="workers", type='int', default=1,
+                    help="total number of workers")
+    optp.add_option("--worker-jids", dest="worker_jids",
+                    help="comma-separated JIDs of all workers, in worker order "
+                         "(required with more than one worker)")
+    optp.add_option("--storage", dest="storage", default='redis',
+                    help="session storage: redis (shared) or memory")
+
+    opts, args = optp.parse_args()
+
+    try:
+        module_levels = logutil.parse_levels(opts.log_levels)
+    except ValueError as e:
+        optp.error(str(e))
+    if not 0 <= opts.worker < opts.workers:
+        optp.error('--worker must be between 0 and --workers - 1')
+    worker_jids = [jid.strip() for jid in (opts.worker_jids or '').split(',') if jid.strip()]
+    if opts.workers > 1 and len(worker_jids) != opts.workers:
+        optp.error('--worker-jids must list one JID for each of the --workers')
+    if worker_jids and opts.jid is None:
+        opts.jid = worker_jids[opts.worker]
+    logutil.setup_logging(opts.loglevel, module_levels,
+                          fmt='%(asctime)s %(levelname)-8s %(name)s %(message)s')
+
+    if opts.jid is None:
+        opts.jid = input("Component JID: ")
+    if opts.secret is None:
+        opts.secret = getpass.getpass("Secret: ")
+    if opts.ballots is None:
+        opts.ballots = input("Ballots: ").split(',')
+    ballots = [name.strip() for names in opts.ballots for name in names.split(',') if name.strip()]
+
+    bot = MemberBotComponent(opts.jid, opts.secret, opts.server, opts.port, ballots,
+                             worker=opts.worker, workers=opts.workers, storage=opts.storage,
+                             worker_jids=worker_jids)
+    bot.connect()
+    bot.process(forever=True)
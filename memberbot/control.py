@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from slixmpp.plugins import BasePlugin, register_plugin
+
+log = logging.getLogger(__name__)
+
+
+class XSFControl(BasePlugin):
+    """
+    Answer operational queries on a local Unix-domain socket.
+
+    Each request is a line holding a command and its arguments, and each
+    reply is a single line: "ok" followed by a JSON document, or "error"
+    followed by a message. Replies are built from the state the plugins
+    already hold in memory, nothing is sent on the XMPP stream, so health
+    checks and monitoring may poll as often as they like.
+
+    Commands: health, stats, roster reload, ballot status [BALLOT], quorum
+    """
+
+    name = 'xsf_control'
+    description = 'XSF: Local control socket'
+    dependencies = set(['xsf_announce', 'xsf_roster', 'xsf_voting', 'xsf_voting_chat'])
+    default_config = {
+        'path': '',
+    }
+
+    def plugin_init(self):
+        self._started = time.monotonic()
+        self._connected = False
+        self._server = None
+        self._commands = {
+            'health': self._health,
+            'stats': self._stats,
+            'roster reload': self._roster_reload,
+            'ballot status': self._ballot_status,
+            'quorum': self._quorum,
+        }
+        self.xmpp.add_event_handler('session_start', self._session_start)
+        self.xmpp.add_event_handler('disconnected', self._disconnected)
+        if self.path:
+            asyncio.ensure_future(self._listen(), loop=self.xmpp.loop)
+
+    def plugin_end(self):
+        self.xmpp.del_event_handler('session_start', self._session_start)
+        self.xmpp.del_event_handler('disconnected', self._disconnected)
+        if self._server:
+            self._server.close()
+            self._server = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _session_start(self, event):
+        self._connected = True
+
+    def _disconnected(self, event):
+        self._connected = False
+
+    async def _listen(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        # Only the bot's user may connect, from the moment the socket exists.
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        finally:
+            os.umask(umask)
+        log.info('Control socket listening on %s', self.path)
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(('%s\n' % self.handle(line.decode('utf-8', 'replace'))).encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def handle(self, line):
+        """Run a single command line and return the reply line."""
+        words = line.split()
+        for length in (2, 1):
+            command = ' '.join(words[:length])
+            if command in self._commands:
+                break
+        else:
+            return 'error unknown command: %s' % ' '.join(words)
+
+        try:
+            result = self._commands[command](words[length:])
+        except (ValueError, OSError) as e:
+            return 'error %s' % e
+        except Exception:
+            log.exception('Control command failed: %s', command)
+            return 'error internal error'
+        return 'ok %s' % json.dumps(result, sort_keys=True)
+
+    def _no_args(self, args):
+        if args:
+            raise ValueError('unexpected arguments: %s' % ' '.join(args))
+
+    def _quorum_status(self, name):
+        # The voters set is what quorum_reached is based on, and the one
+        # shared by all workers in component mode.
+        voting = self.xmpp['xsf_voting']
+        return {'voters': voting.num_voters(name),
+                'quorum': voting.get_quorum(name),
+                'reached': voting.has_quorum(name)}
+
+    def _health(self, args):
+        self._no_args(args)
+        return {
+            'status': 'ok',
+            'connected': self._connected,
+            'uptime': round(time.monotonic() - self._started, 1),
+            'ballots': self.xmpp['xsf_voting'].get_ballots(),
+        }
+
+    def _stats(self, args):
+        self._no_args(args)
+        chat = self.xmpp['xsf_voting_chat']
+        stats = dict(chat.stats)
+        stats['members'] = len(self.xmpp['xsf_roster'].get_members())
+        stats['chat_sessions'] = len(chat.sessions)
+        return stats
+
+    def _roster_reload(self, args):
+        self._no_args(args)
+        roster = self.xmpp['xsf_roster']
+        roster.reload()
+        return {'members': len(roster.get_members())}
+
+    def _ballot_status(self, args):
+        voting = self.xmpp['xsf_voting']
+        if len(args) > 1:
+            raise ValueError('expected at most one ballot name')
+        names = args or voting.get_ballots()
+
+        status = {}
+        for name in names:
+            if name not in voting.get_ballots():
+                raise ValueError('ballot %s is not open' % name)
+            sent, queued = self.xmpp['xsf_announce'].progress(name)
+            status[name] = self._quorum_status(name)
+            status[name]['loaded'] = voting.is_loaded(name)
+            status[name]['announce'] = {'sent': sent, 'queued': queued}
+        return status
+
+    def _quorum(self, args):
+        self._no_args(args)
+        return {name: self._quorum_status(name) for name in self.xmpp['xsf_voting'].get_ballots()}
+
+
+register_plugin(XSFControl)
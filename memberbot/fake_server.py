@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the component port of an XMPP server (XEP-0114), to run
+component.py workers locally without a real server.
+
+Components connect and authenticate with the shared secret as they would
+to a server. Every stanza they send is printed on stdout, prefixed with
+the JID of the component that sent it, and each line read from stdin is
+a stanza delivered to the component named by its 'to' domain:
+
+    <message from='test@localhost/x' to='vote0.localhost' type='chat'><body>hi</body></message>
+
+Nothing is routed between components or to anyone else.
+"""
+import asyncio
+import hashlib
+import logging
+import sys
+import uuid
+
+from optparse import OptionParser
+
+from slixmpp.jid import JID, InvalidJID
+from slixmpp.xmlstream import ET, tostring
+
+import logutil
+
+log = logging.getLogger(__name__)
+
+COMPONENT_NS = 'jabber:component:accept'
+STREAM_NS = 'http://etherx.jabber.org/streams'
+STREAM_HEADER = ("<?xml version='1.0'?><stream:stream xmlns='%s'"
+                 " xmlns:stream='%s' from='%%s' id='%%s'>" % (COMPONENT_NS, STREAM_NS))
+NOT_AUTHORIZED = ("<stream:error><not-authorized xmlns='urn:ietf:params:xml:ns:xmpp-streams'/>"
+                  "</stream:error></stream:stream>")
+
+
+class ComponentConnection(asyncio.Protocol):
+    """One component connected to the server."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.jid = None
+        self.stream_id = uuid.uuid4().hex
+        self.authenticated = False
+        self.parser = ET.XMLPullParser(('start', 'end'))
+        self.root = None
+        self.depth = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if self.authenticated:
+            self.server.components.pop(self.jid, None)
+            log.info('Component %s disconnected', self.jid)
+
+    def data_received(self, data):
+        self.parser.feed(data)
+        try:
+            for event, elem in self.parser.read_events():
+                if event == 'start':
+                    self.depth += 1
+                    if self.depth == 1:
+                        self.stream_started(elem)
+                    continue
+                self.depth -= 1
+                if self.depth == 1:
+                    self.stanza_received(elem)
+                    # Keep memory flat on long running streams.
+                    self.root.remove(elem)
+                elif self.depth == 0:
+                    self.transport.close()
+        except ET.ParseError as e:
+            log.error('Invalid XML from %s: %s', self.jid or 'new component', e)
+            self.transport.close()
+
+    def stream_started(self, root):
+        self.root = root
+        self.jid = root.get('to')
+        self.transport.write((STREAM_HEADER % (self.jid, self.stream_id)).encode('utf-8'))
+
+    def stanza_received(self, elem):
+        if not self.authenticated:
+            expected = hashlib.sha1((self.stream_id + self.server.secret).encode('utf-8')).hexdigest()
+            if elem.tag != '{%s}handshake' % COMPONENT_NS or (elem.text or '').strip().lower() != expected:
+                log.warning('Component %s failed to authenticate', self.jid)
+                self.transport.write(NOT_AUTHORIZED.encode('utf-8'))
+                self.transport.close()
+                return
+            self.authenticated = True
+            self.server.components[self.jid] = self
+            self.transport.write(b'<handshake/>')
+            log.info('Component %s connected', self.jid)
+            return
+        self.server.output.write('%s %s\n' % (self.jid, tostring(elem, xmlns=COMPONENT_NS)))
+        self.server.output.flush()
+
+    def send(self, data):
+        self.transport.write(data.encode('utf-8'))
+
+
+class FakeServer(object):
+
+    def __init__(self, secret, output=sys.stdout):
+        self.secret = secret
+        self.output = output
+        self.components = {}
+
+    def deliver(self, line):
+        """Deliver a stanza to the component its 'to' attribute names."""
+        try:
+            stanza = ET.fromstring("<stream xmlns='%s'>%s</stream>" % (COMPONENT_NS, line))[0]
+            domain = JID(stanza.get('to')).domain
+        except (ET.ParseError, IndexError, InvalidJID) as e:
+            log.error('Not a stanza: %s (%s)', line, e)
+            return
+        component = self.components.get(domain)
+        if component is None:
+            log.error('No component connected as %s', domain)
+            return
+        component.send(tostring(stanza, xmlns=COMPONENT_NS))
+
+    async def read_input(self, loop):
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode('utf-8').strip()
+            if line:
+                self.deliver(line)
+
+
+if __name__ == '__main__':
+    optp = OptionParser()
+    optp.add_option('--host', dest='host', default='localhost',
+                    help='address to listen on')
+    optp.add_option('--port', dest='port', type='int', default=5347,
+                    help='port to accept components on')
+    optp.add_option('-s', '--secret', dest='secret', default='secret',
+                    help='secret the components authenticate with')
+    optp.add_option('-d', '--debug', help='set logging to DEBUG',
+                    action='store_const', dest='loglevel',
+                    const=logging.DEBUG, default=logging.INFO)
+
+    opts, args = optp.parse_args()
+    logutil.setup_logging(opts.loglevel)
+
+    loop = asyncio.get_event_loop()
+    server = FakeServer(opts.secret)
+    listener = loop.run_until_complete(
+        loop.create_server(lambda: ComponentConnection(server), opts.host, opts.port))
+    log.info('Accepting components on %s:%s', opts.host, opts.port)
+    try:
+        loop.run_until_complete(server.read_input(loop))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
@@ -0,0 +1,102 @@
+import atexit
+import copy
+import logging
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `rate` records per second through, dropping the rest.
+
+    The number of dropped records is reported on the next record that is
+    let through, so bursts stay visible without flooding the log.
+    """
+
+    def __init__(self, rate, name=''):
+        super().__init__(name)
+        self.rate = rate
+        self._window = 0
+        self._passed = 0
+        self.dropped = 0
+
+    def filter(self, record):
+        now = int(time.monotonic())
+        if now != self._window:
+            self._window = now
+            self._passed = 0
+        if self._passed >= self.rate:
+            self.dropped += 1
+            return False
+        self._passed += 1
+        if self.dropped:
+            record.msg = '%s (%s similar messages dropped)' % (record.msg, self.dropped)
+            self.dropped = 0
+        return True
+
+
+def _snapshot(value):
+    if isinstance(value, dict):
+        return {key: _snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)(_snapshot(item) for item in value)
+    return value
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue records without formatting them.
+
+    The stock QueueHandler formats the message in the caller's thread. Here
+    only container arguments are copied, so that later changes to them do
+    not show in the log, and the message is formatted on the listener
+    thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, (dict, tuple)):
+            record.args = _snapshot(record.args)
+        return record
+
+
+def parse_levels(specs):
+    """Parse 'logger=LEVEL' strings into (logger, level) pairs."""
+    levels = []
+    for spec in specs or ():
+        name, _, level = spec.partition('=')
+        if not level:
+            raise ValueError('Expected logger=LEVEL, got %r' % spec)
+        level = level.strip().upper()
+        if level.isdigit():
+            level = int(level)
+        elif not isinstance(logging.getLevelName(level), int):
+            raise ValueError('Unknown log level in %r' % spec)
+        else:
+            level = logging.getLevelName(level)
+        levels.append((name.strip(), level))
+    return levels
+
+
+def setup_logging(level, module_levels=(), fmt='%(levelname)-8s %(message)s'):
+    """
+    Send all log records through a queue, so that formatting and writing
+    them out happens on a listener thread instead of the caller's (usually
+    the event loop).
+    """
+    queue = SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(fmt))
+    listener = QueueListener(queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(queue))
+    for name, module_level in module_levels:
+        logging.getLogger(name).setLevel(module_level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -15,16 +15,18 @@ from optparse import OptionParser
 import xsf_roster
 import voting
 import adhoc_voting
+import admin_voting
+import announce
 import chat_voting
-
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s %(levelname)-8s %(message)s')
+import logutil
+import recorder
+import control
 
 
 class MemberBot(slixmpp.ClientXMPP):
 
-    def __init__(self, jid, password, ballot):
-        super(MemberBot, self).__init__(jid, password)
+    def __init__(self, jid, password, ballots, plugin_config=None):
+        super(MemberBot, self).__init__(jid, password, plugin_config=plugin_config)
 
         self.auto_authorize = None
         self.auto_subscribe = None
@@ -60,15 +62,23 @@ class MemberBot(slixmpp.ClientXMPP):
         self.add_event_handler('session_start', self.session_start)
         self.add_event_handler('roster_subscription_request',
                                self.roster_subscription_request)
+        self.add_event_handler('presence_available', self.presence_available)
         self.add_event_handler('quorum_reached', self.quorum_reached)
 
-        self.plugin.enable('xsf_roster')
-        self.plugin.enable('xsf_voting')
-        # self.plugin.enable('xsf_voting_adhoc')
-        self.plugin.enable('xsf_voting_chat')
+        self.register_plugin('xsf_roster')
+        self.register_plugin('xsf_voting')
+        # self.register_plugin('xsf_voting_adhoc')
+        self.register_plugin('xsf_voting_chat')
+        self.register_plugin('xsf_announce')
+        self.register_plugin('xsf_voting_admin')
+        if self.plugin_config.get('xsf_recorder', {}).get('path'):
+            self.register_plugin('xsf_recorder')
+        if self.plugin_config.get('xsf_control', {}).get('path'):
+            self.register_plugin('xsf_control')
 
         quorum = math.ceil(len(self['xsf_roster'].get_members()) / 3)
-        self['xsf_voting'].load_ballot(ballot, quorum)
+        for ballot in ballots:
+            self['xsf_voting'].open_ballot(ballot, quorum)
 
     def session_start(self, event):
         self.get_roster()
@@ -78,7 +88,7 @@ class MemberBot(slixmpp.ClientXMPP):
         self['xep_0172'].publish_nick('XSF Memberbot')
         self['xep_0108'].publish_activity('working')
 
-        if self['xsf_voting'].has_quorum():
+        if self.has_quorum():
             self['xep_0107'].publish_mood('happy')
         else:
             self['xep_0107'].publish_mood('serious')
@@ -128,8 +138,16 @@ class MemberBot(slixmpp.ClientXMPP):
         else:
             self.send_presence(pto=pres['from'], ptype='unsubscribed')
 
-    def quorum_reached(self, event):
-        self['xep_0107'].publish_mood('happy')
+    def presence_available(self, pres):
+        if self['xsf_roster'].is_member(pres['from']):
+            self['xsf_voting_chat'].prewarm(pres['from'])
+
+    def has_quorum(self):
+        return all(self['xsf_voting'].has_quorum(ballot) for ballot in self['xsf_voting'].get_ballots())
+
+    def quorum_reached(self, ballot):
+        if self.has_quorum():
+            self['xep_0107'].publish_mood('happy')
 
 
 if __name__ == '__main__':
@@ -146,28 +164,46 @@ if __name__ == '__main__':
     optp.add_option('-v', '--verbose', help='set logging to COMM',
                     action='store_const', dest='loglevel',
                     const=5, default=logging.INFO)
+    optp.add_option('-l', '--log-level', dest='log_levels', action='append',
+                    metavar='LOGGER=LEVEL',
+                    help='set the level of a single logger, e.g. voting.storage=DEBUG (may be repeated)')
 
     # JID and password options.
     optp.add_option("-j", "--jid", dest="jid",
                     help="JID to use")
     optp.add_option("-p", "--password", dest="password",
                     help="password to use")
-    optp.add_option("-b", "--ballot", dest="ballot",
-                    help="name of the ballot")
+    optp.add_option("-b", "--ballot", dest="ballots", action="append",
+                    help="name of a ballot to open (may be repeated)")
+    optp.add_option("--record", dest="record",
+                    help="record anonymized voter traffic to this file")
+    optp.add_option("--control", dest="control",
+                    help="path of a Unix socket accepting control commands")
 
     opts, args = optp.parse_args()
 
     # Setup logging.
-    logging.basicConfig(level=opts.loglevel,
-                        format='%(levelname)-8s %(message)s')
+    try:
+        module_levels = logutil.parse_levels(opts.log_levels)
+    except ValueError as e:
+        optp.error(str(e))
+    logutil.setup_logging(opts.loglevel, module_levels,
+                          fmt='%(asctime)s %(levelname)-8s %(name)s %(message)s')
 
     if opts.jid is None:
         opts.jid = input("Username: ")
     if opts.password is None:
         opts.password = getpass.getpass("Password: ")
-    if opts.ballot is None:
-        opts.ballot = input("Ballot: ")
+    if opts.ballots is None:
+        opts.ballots = input("Ballots: ").split(',')
+    ballots = [name.strip() for names in opts.ballots for name in names.split(',') if name.strip()]
+
+    plugin_config = {}
+    if opts.record:
+        plugin_config['xsf_recorder'] = {'path': opts.record}
+    if opts.control:
+        plugin_config['xsf_control'] = {'path': opts.control}
 
-    bot = MemberBot(opts.jid, opts.password, opts.ballot)
+    bot = MemberBot(opts.jid, opts.password, ballots, plugin_config)
     bot.connect()
     bot.process(forever=True)
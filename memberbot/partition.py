@@ -0,0 +1,33 @@
+import hashlib
+from bisect import bisect
+
+from slixmpp.jid import JID
+
+
+class HashRing(object):
+    """
+    Consistent hashing of voters over a number of workers.
+
+    Each worker is placed on the ring several times so that voters spread
+    evenly, and changing the number of workers only moves the voters of
+    the affected ring segments.
+    """
+
+    def __init__(self, workers, replicas=160):
+        self.workers = workers
+        ring = []
+        for worker in range(workers):
+            for replica in range(replicas):
+                ring.append((self._hash('%s-%s' % (worker, replica)), worker))
+        ring.sort()
+        self._keys = [key for key, _ in ring]
+        self._workers = [worker for _, worker in ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def owner(self, jid):
+        """Return the worker number responsible for a voter."""
+        index = bisect(self._keys, self._hash(JID(jid).bare)) % len(self._keys)
+        return self._workers[index]
@@ -0,0 +1,118 @@
+import atexit
+import gzip
+import json
+import time
+
+from slixmpp.jid import JID, InvalidJID
+from slixmpp.plugins import BasePlugin, register_plugin
+
+
+class XSFRecorder(BasePlugin):
+    """
+    Record the chat messages and ad-hoc command requests sent by members,
+    for later replay with replay.py.
+
+    Voter JIDs are replaced by made up ones (voterN@members.invalid) as
+    they are written, including those given as form values, and the real
+    JIDs are never stored. Admin commands are not recorded.
+
+    Entries are buffered and flushed every `flush_interval` seconds, since
+    every gzip flush costs compression and a write on the event loop.
+    """
+
+    name = 'xsf_recorder'
+    description = 'XSF: Record voter traffic for replay'
+    dependencies = set(['xsf_roster', 'xsf_voting'])
+    default_config = {
+        'path': '',
+        'flush_interval': 5,
+    }
+
+    def plugin_init(self):
+        self._voters = {}
+        self._resources = {}
+        self._file = None
+        self._timer = None
+        if not self.path:
+            return
+
+        self._start = time.monotonic()
+        self._file = gzip.open(self.path, 'wt')
+        atexit.register(self._close)
+        self._write({'version': 1})
+        for name in self.xmpp['xsf_voting'].get_ballots():
+            self._ballot_opened(name)
+        self.xmpp.add_event_handler('message', self._record)
+        self.xmpp.add_event_handler('command', self._record)
+        self.xmpp.add_event_handler('xsf_ballot_opened', self._ballot_opened)
+
+    def plugin_end(self):
+        if self._file:
+            self.xmpp.del_event_handler('message', self._record)
+            self.xmpp.del_event_handler('command', self._record)
+            self.xmpp.del_event_handler('xsf_ballot_opened', self._ballot_opened)
+            atexit.unregister(self._close)
+            self._close()
+
+    def _close(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(',', ':')))
+        self._file.write('\n')
+        if not self._timer:
+            self._timer = self.xmpp.loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self):
+        self._timer = None
+        if self._file:
+            self._file.flush()
+
+    def anonymize(self, jid):
+        jid = JID(jid)
+        if jid.bare not in self._voters:
+            self._voters[jid.bare] = 'voter%s@members.invalid' % len(self._voters)
+        bare = self._voters[jid.bare]
+        if not jid.resource:
+            return JID(bare)
+        resources = self._resources.setdefault(jid.bare, {})
+        if jid.resource not in resources:
+            resources[jid.resource] = 'r%s' % len(resources)
+        return JID('%s/%s' % (bare, resources[jid.resource]))
+
+    def _ballot_opened(self, name):
+        self._write({'t': round(time.monotonic() - self._start, 3), 'ballot': name})
+
+    def _record(self, stanza):
+        if stanza.name == 'message' and stanza['type'] not in ('normal', 'chat'):
+            return
+        if stanza.name == 'iq' and stanza['command']['node'].startswith('admin:'):
+            # Admin commands are not voter traffic, and their forms hold the
+            # JIDs of other members.
+            return
+        if not self.xmpp['xsf_roster'].is_member(stanza['from']):
+            return
+
+        stanza = stanza.__copy__()
+        stanza['from'] = self.anonymize(stanza['from'])
+        stanza['to'] = ''
+        for elem in list(stanza.xml):
+            # Drop anything that could carry the voter's identity or client
+            # details, other than what the handlers actually look at.
+            if elem.tag.split('}')[-1] not in ('body', 'origin-id', 'command'):
+                stanza.xml.remove(elem)
+        for value in stanza.xml.iter('{jabber:x:data}value'):
+            if value.text and '@' in value.text:
+                try:
+                    value.text = str(self.anonymize(value.text))
+                except InvalidJID:
+                    value.text = ''
+        self._write({'t': round(time.monotonic() - self._start, 3), 'xml': str(stanza)})
+
+
+register_plugin(XSFRecorder)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from optparse import OptionParser
+
+from slixmpp.jid import JID
+from slixmpp.xmlstream import ET, tostring
+
+import logutil
+from memberbot import MemberBot
+
+BOT_JID = 'memberbot@replay.invalid/replay'
+COMMAND_NS = 'http://jabber.org/protocol/commands'
+STREAM_HEADER = ("<stream:stream xmlns='jabber:client'"
+                 " xmlns:stream='http://etherx.jabber.org/streams'"
+                 " from='replay.invalid' id='replay' version='1.0'>")
+
+
+class FakeTransport(object):
+    """
+    Stands in for the server connection: records when the bot answers the
+    voter it is waiting on, and which ad-hoc session ids it hands out to
+    each voter.
+    """
+
+    def __init__(self):
+        self.stanzas = 0
+        self.waiter = None
+        self.voter = None
+        self.sessionids = {}
+
+    def expect(self, voter, loop):
+        """Start waiting for the next reply sent to a voter."""
+        self.voter = voter
+        self.waiter = loop.create_future()
+        return self.waiter
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if not data.startswith('<iq') and not data.startswith('<message'):
+            return
+        try:
+            xml = ET.fromstring(data)
+        except ET.ParseError:
+            return
+
+        command = xml.find('{%s}command' % COMMAND_NS)
+        if command is not None and command.get('sessionid'):
+            self.sessionids[xml.get('to')] = command.get('sessionid')
+        if data.startswith('<iq') and xml.get('type') not in ('result', 'error'):
+            return
+
+        self.stanzas += 1
+        if self.waiter is not None and xml.get('to') == self.voter and not self.waiter.done():
+            self.waiter.set_result(time.perf_counter())
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+def read_recording(path):
+    with gzip.open(path, 'rt') as recording:
+        header = json.loads(next(recording))
+        if header.get('version') != 1:
+            raise ValueError('Unsupported recording version: %s' % header.get('version'))
+        try:
+            for line in recording:
+                yield json.loads(line)
+        except (EOFError, ValueError):
+            # The bot was killed without closing the recording; replay
+            # what was flushed before that.
+            return
+
+
+def scan_recording(path):
+    """Return the ballots and the voters appearing in a recording."""
+    ballots = []
+    voters = set()
+    for entry in read_recording(path):
+        if 'ballot' in entry and entry['ballot'] not in ballots:
+            ballots.append(entry['ballot'])
+        elif 'xml' in entry:
+            voters.add(JID(ET.fromstring(entry['xml']).get('from')).bare)
+    return ballots, voters
+
+
+def prepare_data_dir(data_dir, ballots, voters):
+    replay_dir = tempfile.mkdtemp(prefix='memberbot-replay-')
+    for name in ballots:
+        shutil.copy('%s/ballot_%s.xml' % (data_dir, name), replay_dir)
+    with open('%s/xsf_roster.txt' % replay_dir, 'w') as roster:
+        for jid in sorted(voters):
+            roster.write('%s\n' % jid)
+    open('%s/xsf_admins.txt' % replay_dir, 'w').close()
+    return replay_dir
+
+
+def create_bot(replay_dir, ballots):
+    plugin_config = {
+        'xsf_roster': {'data_dir': replay_dir},
+        'xsf_voting': {'data_dir': replay_dir, 'ballot_watch_interval': 0},
+        'xsf_announce': {'data_dir': replay_dir},
+    }
+    bot = MemberBot(BOT_JID, 'replay', ballots, plugin_config)
+    transport = FakeTransport()
+    # What connect() would do, minus the actual connection.
+    asyncio.ensure_future(bot.run_filters(), loop=bot.loop)
+    bot.connection_made(transport)
+    bot.data_received(STREAM_HEADER)
+    bot.session_bind_event.set()
+    bot.event('session_bind', bot.boundjid)
+    bot.event('session_start')
+    return bot, transport
+
+
+def _rewrite(xml, transport, sessionids):
+    # Recorded stanzas leave out the stream's default namespace.
+    stanza = ET.fromstring("<stream xmlns='jabber:client'>%s</stream>" % xml)[0]
+    stanza.set('to', BOT_JID)
+    command = stanza.find('{%s}command' % COMMAND_NS)
+    if command is not None and command.get('sessionid'):
+        recorded = command.get('sessionid')
+        if recorded not in sessionids:
+            sessionids[recorded] = transport.sessionids.get(stanza.get('from'), recorded)
+        command.set('sessionid', sessionids[recorded])
+    return tostring(stanza, xmlns='jabber:client')
+
+
+async def drain(bot):
+    """
+    Let the handlers of the stanzas fed so far run, and wait until all
+    they sent has gone through the send queue.
+    """
+    await asyncio.sleep(0)
+    await bot.waiting_queue.join()
+
+
+async def replay(bot, transport, path, speed=1.0, timeout=5.0):
+    """
+    Feed the recorded stanzas to the bot, at the recorded pace divided by
+    speed (or as fast as possible for a speed of 0), waiting for each one
+    to be answered. A stanza counts as answered by the first message or
+    iq reply sent back to its sender.
+
+    Returns the elapsed time, the response latencies and the number of
+    stanzas that got no answer. Time spent waiting for answers that never
+    came is left out of the elapsed time.
+    """
+    latencies = []
+    unanswered = 0
+    idle = 0
+    sessionids = {}
+    start = time.perf_counter()
+    for entry in read_recording(path):
+        if 'xml' not in entry:
+            continue
+        if speed:
+            delay = entry['t'] / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        data = _rewrite(entry['xml'], transport, sessionids)
+        waiter = transport.expect(ET.fromstring(entry['xml']).get('from'), bot.loop)
+        sent = time.perf_counter()
+        bot.data_received(data)
+        # Replies to this stanza must be out before the next one is fed,
+        # or they would be taken for replies to it.
+        await drain(bot)
+        if not waiter.done():
+            waited = time.perf_counter()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            except asyncio.TimeoutError:
+                idle += time.perf_counter() - waited
+                unanswered += 1
+                continue
+            await drain(bot)
+        latencies.append(waiter.result() - sent)
+
+    await drain(bot)
+    return time.perf_counter() - start - idle, latencies, unanswered
+
+
+def fingerprint(bot, replay_dir, voters):
+    """Summarize the final voting state and result files of a replay."""
+    voting = bot['xsf_voting']
+    state = {}
+    for name in voting.get_ballots():
+        results = {}
+        results_dir = '%s/results/%s' % (replay_dir, name)
+        if os.path.isdir(results_dir):
+            for filename in sorted(os.listdir(results_dir)):
+                with open(os.path.join(results_dir, filename), 'rb') as result:
+                    results[filename] = hashlib.sha256(result.read()).hexdigest()
+        state[name] = {
+            'sessions': {jid: voting.get_session(JID(jid), ballot=name) for jid in sorted(voters)},
+            'tally': voting.get_tally(name) if voting.is_loaded(name) else {},
+            'results': results,
+        }
+    return json.loads(json.dumps(state, sort_keys=True))
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(elapsed, latencies, unanswered, out=sys.stdout):
+    handled = len(latencies) + unanswered
+    out.write('Stanzas replayed: %s in %.3fs (%.1f/s)\n' % (handled, elapsed, handled / elapsed if elapsed else 0))
+    out.write('Unanswered: %s\n' % unanswered)
+    if latencies:
+        latencies = sorted(latencies)
+        out.write('Latency (ms): p50 %.3f / p90 %.3f / p99 %.3f / max %.3f\n' % (
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.9) * 1000,
+            percentile(latencies, 0.99) * 1000,
+            latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    optp = OptionParser(usage='%prog [options] RECORDING')
+    optp.add_option('--data-dir', dest='data_dir', default='data',
+                    help='directory holding the recorded ballots')
+    optp.add_option('-s', '--speed', dest='speed', default='1',
+                    help='replay speed: 1 for real time, N for N times faster, '
+                         'or max for no pauses at all')
+    optp.add_option('--seed', dest='seed', type='int', default=0,
+                    help='random seed, for repeatable ballot shuffling')
+    optp.add_option('--timeout', dest='timeout', type='float', default=5.0,
+                    help='seconds to wait for an answer to each stanza')
+    optp.add_option('--expect', dest='expect',
+                    help='compare the final state to this file')
+    optp.add_option('--save', dest='save',
+                    help='write the final state to this file')
+    optp.add_option('-d', '--debug', help='set logging to DEBUG',
+                    action='store_const', dest='loglevel',
+                    const=logging.DEBUG, default=logging.WARNING)
+
+    opts, args = optp.parse_args()
+    if len(args) != 1:
+        optp.error('a recording is required')
+    speed = 0 if opts.speed == 'max' else float(opts.speed)
+
+    logutil.setup_logging(opts.loglevel)
+    random.seed(opts.seed)
+
+    ballots, voters = scan_recording(args[0])
+    replay_dir = prepare_data_dir(opts.data_dir, ballots, voters)
+    try:
+        bot, transport = create_bot(replay_dir, ballots)
+        elapsed, latencies, unanswered = bot.loop.run_until_complete(
+            replay(bot, transport, args[0], speed, opts.timeout))
+        report(elapsed, latencies, unanswered)
+
+        state = fingerprint(bot, replay_dir, voters)
+    finally:
+        shutil.rmtree(replay_dir, ignore_errors=True)
+
+    if opts.save:
+        with open(opts.save, 'w') as saved:
+            json.dump(state, saved, indent=2, sort_keys=True)
+    if opts.expect:
+        with open(opts.expect) as expected_file:
+            expected = json.load(expected_file)
+        mismatched = sorted(name for name in set(expected) | set(state)
+                            if expected.get(name) != state.get(name))
+        if mismatched:
+            print('State differs from %s for: %s' % (opts.expect, ', '.join(mismatched)))
+            sys.exit(1)
+        print('State matches %s' % opts.expect)
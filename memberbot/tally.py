@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+import logging
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+from optparse import OptionParser
+
+log = logging.getLogger(__name__)
+
+BALLOT_NS = '{http://xmpp.org/protocol/xsf}'
+ANSWER_TAG = re.compile(r'^answer(\d+)$')
+
+# The ballot shared with worker processes, set by _init_worker.
+_ballot = None
+
+
+class BallotSpec(object):
+    """
+    The parts of a compiled ballot needed for tallying: the section titles
+    with their seat limits and candidates, in ballot order.
+    """
+
+    def __init__(self, path):
+        self.sections = []
+        root = ET.parse(path).getroot()
+        for section in root.iter(BALLOT_NS + 'section'):
+            limit = section.get('limit')
+            names = [item.get('name') for item in section.iter(BALLOT_NS + 'item')]
+            self.sections.append((section.get('title'), int(limit) if limit else 0, names))
+
+    def find(self, title):
+        for section in self.sections:
+            if section[0].lower() == title.lower():
+                return section
+
+    def unlimited(self):
+        return [section for section in self.sections if not section[1]]
+
+
+def tally_respondent(respondent, ballot, counts):
+    """
+    Add the votes of one <respondent/> element, as written by
+    XSFVoting.end_voting, to counts.
+
+    Membership style sections are written as a flat run of <answerN/>
+    elements without a section wrapper, so the numbering restarting at
+    zero is what separates one section from the next.
+    """
+    counts['respondents'] += 1
+    unlimited = ballot.unlimited()
+    cursor = -1
+    for child in respondent:
+        if not isinstance(child.tag, str):
+            continue
+        match = ANSWER_TAG.match(child.tag)
+        if match:
+            index = int(match.group(1))
+            if index == 0:
+                cursor += 1
+            if cursor < 0 or cursor >= len(unlimited) or index >= len(unlimited[cursor][2]):
+                counts[('errors', 'unknown answer', child.tag)] += 1
+                continue
+            title, _, names = unlimited[cursor]
+            counts[(title, names[index], (child.text or '').strip())] += 1
+            continue
+
+        section = ballot.find(child.tag)
+        if section is None:
+            counts[('errors', 'unknown section', child.tag)] += 1
+            continue
+        title, limit, names = section
+        chosen = 0
+        for item in child:
+            name = item.get('name')
+            vote = (item.text or '').strip()
+            if name not in names:
+                counts[('errors', 'unknown candidate', name)] += 1
+                continue
+            counts[(title, name, vote)] += 1
+            if vote == 'yes':
+                chosen += 1
+        if limit and chosen > limit:
+            counts[('errors', 'over limit', title)] += 1
+
+
+def tally_file(path, ballot):
+    counts = Counter()
+    parents = []
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == 'respondent':
+            tally_respondent(elem, ballot, counts)
+            # Clearing it would still leave an empty element behind for
+            # every respondent of a consolidated file.
+            if parents:
+                parents[-1].remove(elem)
+            else:
+                elem.clear()
+    return counts
+
+
+def _init_worker(ballot):
+    global _ballot
+    _ballot = ballot
+
+
+def _tally_files(paths):
+    counts = Counter()
+    for path in paths:
+        try:
+            counts.update(tally_file(path, _ballot))
+        except ET.ParseError as e:
+            counts[('errors', 'unreadable', os.path.basename(path))] += 1
+            log.error('%s: %s', path, e)
+    return counts
+
+
+def _chunks(paths, size):
+    paths = iter(paths)
+    chunk = list(islice(paths, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(paths, size))
+
+
+def result_files(results_dir):
+    with os.scandir(results_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.xml') and entry.is_file():
+                yield entry.path
+
+
+def tally_dir(results_dir, ballot, processes=None, chunk_size=256):
+    """
+    Tally every respondent file in results_dir across a process pool.
+
+    Files are handed out in chunks and each worker returns only its
+    partial counts, which are merged as they arrive.
+    """
+    counts = Counter()
+    with Pool(processes, initializer=_init_worker, initargs=(ballot,)) as pool:
+        for partial in pool.imap_unordered(_tally_files, _chunks(result_files(results_dir), chunk_size)):
+            counts.update(partial)
+    return counts
+
+
+def report(counts, ballot, out=sys.stdout):
+    out.write('Respondents: %s\n' % counts['respondents'])
+    for title, limit, names in ballot.sections:
+        out.write('\n%s%s:\n' % (title, ' (%s seats)' % limit if limit else ''))
+        ranked = sorted(names, key=lambda name: -counts[(title, name, 'yes')])
+        for name in ranked:
+            if limit:
+                out.write('  %s: %s\n' % (name, counts[(title, name, 'yes')]))
+            else:
+                out.write('  %s: %s yes / %s no\n' % (name,
+                                                      counts[(title, name, 'yes')],
+                                                      counts[(title, name, 'no')]))
+
+    errors = sorted((key, count) for key, count in counts.items()
+                    if isinstance(key, tuple) and key[0] == 'errors')
+    if errors:
+        out.write('\nProblems found:\n')
+        for (_, kind, what), count in errors:
+            out.write('  %s: %s (%s)\n' % (kind, what, count))
+    return not errors
+
+
+if __name__ == '__main__':
+    optp = OptionParser(usage='%prog [options] -b BALLOT')
+    optp.add_option('-b', '--ballot', dest='ballot',
+                    help='name of the ballot')
+    optp.add_option('--data-dir', dest='data_dir', default='data',
+                    help='directory holding the ballots and results')
+    optp.add_option('-f', '--file', dest='results_file',
+                    help='consolidated results file to tally instead of '
+                         'the results directory')
+    optp.add_option('-j', '--jobs', dest='jobs', type='int', default=None,
+                    help='number of worker processes')
+
+    opts, args = optp.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)-8s %(message)s')
+
+    if opts.ballot is None:
+        optp.error('a ballot name is required')
+
+    path = '%s/ballot_%s.xml' % (opts.data_dir, opts.ballot)
+    try:
+        ballot = BallotSpec(path)
+        if opts.results_file:
+            path = opts.results_file
+            counts = tally_file(path, ballot)
+        else:
+            path = '%s/results/%s' % (opts.data_dir, opts.ballot)
+            counts = tally_dir(path, ballot, opts.jobs)
+    except (ET.ParseError, OSError) as e:
+        log.error('%s: %s', path, e)
+        sys.exit(1)
+
+    sys.exit(0 if report(counts, ballot) else 1)
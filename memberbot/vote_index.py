@@ -0,0 +1,147 @@
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+class VoteIndex:
+    """
+    Compact index of the votes recorded for a ballot.
+
+    Each voter is assigned a small ordinal the first time they are seen,
+    and every (section, candidate, answer) triple keeps a single integer
+    used as a bitset of voter ordinals. Recording a vote flips the voter's
+    bit, and the total for a candidate is the popcount of its bitset.
+
+    Voters whose ballots are final are tracked in a separate bitset, and
+    running per-candidate counters are kept for them so that the standings
+    of completed ballots can be read without any popcounts at all.
+
+    A voter recasting their ballot is put on hold: the votes that were
+    counted stay in the counters until the new ballot is final, and are
+    swapped for it then.
+    """
+
+    def __init__(self, members=()):
+        self._ordinals = {}
+        self._voters = []
+        self._sections = {}
+        self._final = 0
+        self._held = {}
+        self._counts = {}
+        for jid in sorted(members):
+            self.ordinal(jid)
+
+    def __len__(self):
+        return len(self._voters)
+
+    def ordinal(self, jid):
+        jid = str(jid)
+        if jid not in self._ordinals:
+            self._ordinals[jid] = len(self._voters)
+            self._voters.append(jid)
+        return self._ordinals[jid]
+
+    def set_votes(self, jid, section, answers):
+        """
+        Replace the votes of a voter for a ballot section.
+
+        :param answers: An iterable of (candidate, answer) pairs.
+        """
+        bit = 1 << self.ordinal(jid)
+        final = self._final & bit
+        bitsets = self._sections.setdefault(section, {})
+        answers = set(answers)
+        for key in set(bitsets) | answers:
+            bits = bitsets.get(key, 0)
+            if key in answers and not bits & bit:
+                bitsets[key] = bits | bit
+                if final:
+                    self._count(section, key, 1)
+            elif key not in answers and bits & bit:
+                bitsets[key] = bits & ~bit
+                if final:
+                    self._count(section, key, -1)
+
+    def clear(self, jid):
+        """Start a voter over with no votes, holding any counted ones."""
+        self.hold(jid)
+        bit = 1 << self.ordinal(jid)
+        for bitsets in self._sections.values():
+            for key in bitsets:
+                bitsets[key] &= ~bit
+
+    def hold(self, jid):
+        """
+        Let a voter change their votes while the ones counted so far stay
+        in the running totals, until finalize() swaps them for the new ones.
+        """
+        bit = 1 << self.ordinal(jid)
+        if self._final & bit:
+            self._final &= ~bit
+            self._held[bit] = [(section, key)
+                               for section, bitsets in self._sections.items()
+                               for key, bits in bitsets.items() if bits & bit]
+
+    def finalize(self, jid):
+        """Count the current votes of a voter in the running totals."""
+        bit = 1 << self.ordinal(jid)
+        self._release(bit)
+        if not self._final & bit:
+            self._final |= bit
+            self._count_voter(bit, 1)
+
+    def retract(self, jid):
+        """Remove the votes of a voter from the running totals."""
+        bit = 1 << self.ordinal(jid)
+        self._release(bit)
+        if self._final & bit:
+            self._final &= ~bit
+            self._count_voter(bit, -1)
+
+    def _release(self, bit):
+        for section, key in self._held.pop(bit, ()):
+            self._count(section, key, -1)
+
+    def is_final(self, jid):
+        if str(jid) not in self._ordinals:
+            return False
+        bit = 1 << self._ordinals[str(jid)]
+        return bool(self._final & bit) or bit in self._held
+
+    def num_final(self):
+        return popcount(self._final) + len(self._held)
+
+    def _count(self, section, key, delta):
+        counts = self._counts.setdefault(section, {})
+        counts[key] = counts.get(key, 0) + delta
+
+    def _count_voter(self, bit, delta):
+        for section, bitsets in self._sections.items():
+            for key, bits in bitsets.items():
+                if bits & bit:
+                    self._count(section, key, delta)
+
+    def voters(self, section, candidate, answer='yes'):
+        bits = self._sections.get(section, {}).get((candidate, answer), 0)
+        return [jid for i, jid in enumerate(self._voters) if bits >> i & 1]
+
+    def total(self, section, candidate, answer='yes'):
+        return popcount(self._sections.get(section, {}).get((candidate, answer), 0))
+
+    def count(self, section, candidate, answer='yes'):
+        return self._counts.get(section, {}).get((candidate, answer), 0)
+
+    def counts(self):
+        counts = {}
+        for section, keys in self._counts.items():
+            section_counts = counts.setdefault(section, {})
+            for (candidate, answer), count in keys.items():
+                section_counts.setdefault(candidate, {})[answer] = count
+        return counts
+
+    def totals(self):
+        totals = {}
+        for section, bitsets in self._sections.items():
+            counts = totals.setdefault(section, {})
+            for (candidate, answer), bits in bitsets.items():
+                counts.setdefault(candidate, {})[answer] = popcount(bits)
+        return totals
@@ -1,9 +1,22 @@
-import sys
+import copy
+import io
+import json
+import logging
 import os
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from slixmpp.jid import JID
 from slixmpp.xmlstream import ET, ElementBase, register_stanza_plugin
 from slixmpp.plugins import BasePlugin, register_plugin
 
+from audit import MerkleLog
+from logutil import RateLimitFilter
+from vote_index import VoteIndex
+
 
 class Ballot(ElementBase):
     name = 'ballot'
@@ -37,161 +50,554 @@ class BallotItem(ElementBase):
 register_stanza_plugin(Ballot, BallotSection, iterable=True)
 register_stanza_plugin(BallotSection, BallotItem, iterable=True)
 
+log = logging.getLogger(__name__)
+storage_log = logging.getLogger(__name__ + '.storage')
+
 
 class Redis:
     def __init__(self):
         self.data = {}
 
     def scard(self, myhash):
-        print('scard', myhash, file=sys.stderr)
+        storage_log.debug('scard %s', myhash)
         if myhash not in self.data:
             return 0
         return len(self.data[myhash])
 
     def hgetall(self, myhash):
-        print('hgetall', myhash, file=sys.stderr)
+        storage_log.debug('hgetall %s', myhash)
         if myhash not in self.data:
             return None
-        print('hgetall', self.data[myhash], file=sys.stderr)
+        if storage_log.isEnabledFor(logging.DEBUG):
+            storage_log.debug('hgetall %s -> %r', myhash, self.data[myhash])
         return self.data[myhash]
 
     def hset(self, myhash, field, value):
-        print('hset', myhash, field, value, file=sys.stderr)
+        if storage_log.isEnabledFor(logging.DEBUG):
+            storage_log.debug('hset %s %s %r', myhash, field, value)
         thing = self.data.setdefault(myhash, {})
         ret = int(field not in thing)
         thing[field] = value
         return ret
 
+    def hset_many(self, myhash, mapping):
+        if storage_log.isEnabledFor(logging.DEBUG):
+            storage_log.debug('hset %s %r', myhash, mapping)
+        thing = self.data.setdefault(myhash, {})
+        ret = len(set(mapping) - set(thing))
+        thing.update(mapping)
+        return ret
+
     def sadd(self, myhash, *members):
-        print('sadd', myhash, file=sys.stderr)
+        storage_log.debug('sadd %s', myhash)
         thing = self.data.setdefault(myhash, set())
-        thing.add(members)
-        return 1
+        ret = len(set(members) - thing)
+        thing.update(members)
+        return ret
+
+    def sismember(self, myhash, member):
+        storage_log.debug('sismember %s', myhash)
+        return member in self.data.get(myhash, ())
+
+
+class SharedRedis:
+    """
+    Storage in a real Redis server, so that several bot processes can share
+    voting sessions. Session fields are stored as JSON.
+    """
+
+    def __init__(self, host, port, db):
+        if redis is None:
+            raise ImportError('The redis package is required for shared storage')
+        self.client = redis.StrictRedis(host=host, port=port, db=db, decode_responses=True)
+
+    def scard(self, myhash):
+        storage_log.debug('scard %s', myhash)
+        return self.client.scard(myhash)
+
+    def hgetall(self, myhash):
+        storage_log.debug('hgetall %s', myhash)
+        data = self.client.hgetall(myhash)
+        if not data:
+            return None
+        return {field: json.loads(value) for field, value in data.items()}
+
+    def hset(self, myhash, field, value):
+        storage_log.debug('hset %s %s', myhash, field)
+        return self.client.hset(myhash, field, json.dumps(value))
+
+    def hset_many(self, myhash, mapping):
+        # A single HSET for all the fields, rather than one round trip each.
+        storage_log.debug('hset %s %s', myhash, ' '.join(mapping))
+        return self.client.hset(myhash, mapping={field: json.dumps(value) for field, value in mapping.items()})
+
+    def sadd(self, myhash, *members):
+        storage_log.debug('sadd %s', myhash)
+        return self.client.sadd(myhash, *members)
+
+    def sismember(self, myhash, member):
+        storage_log.debug('sismember %s', myhash)
+        return self.client.sismember(myhash, member)
+
+
+class BallotState(object):
+    """
+    An open ballot. The ballot file is only compiled the first time the
+    ballot is used, and is dropped again when the ballot is closed.
+    """
+
+    def __init__(self, name, quorum):
+        self.name = name
+        self.quorum = quorum
+        self.data = None
+        self.votes = None
+        self.audit = None
+        self.mtime = None
 
 
 class XSFVoting(BasePlugin):
     name = 'xsf_voting'
     description = 'XSF: Proxy voting'
-    dependencies = set()
+    dependencies = set(['xsf_roster'])
     default_config = {
         'redis_host': 'localhost',
         'redis_port': 6379,
         'redis_db': 0,
+        'storage': 'memory',
         'key_prefix': 'xsf:memberbot',
         'current_ballot': '',
         'data_dir': 'data',
+        'ballot_watch_interval': 5,
+        'storage_log_rate': 20,
     }
 
     def plugin_init(self):
-        self.redis = Redis()
-        self._ballot_data = None
+        if self.storage == 'redis':
+            self.redis = SharedRedis(self.redis_host, self.redis_port, self.redis_db)
+        else:
+            self.redis = Redis()
+        self._ballots = {}
+        self._storage_log_filter = RateLimitFilter(self.storage_log_rate)
+        storage_log.addFilter(self._storage_log_filter)
+
+    def session_bind(self, event):
+        if self.ballot_watch_interval:
+            self.xmpp.cancel_schedule('xsf_ballot_watch')
+            self.xmpp.schedule('xsf_ballot_watch', self.ballot_watch_interval,
+                               self._check_ballots, repeat=True)
+
+    def plugin_end(self):
+        self.xmpp.cancel_schedule('xsf_ballot_watch')
+        storage_log.removeFilter(self._storage_log_filter)
+
+    def open_ballot(self, name, quorum):
+        """
+        Make a ballot available for voting. The first ballot opened becomes
+        the default for calls that do not name a ballot.
+        """
+        if name not in self._ballots:
+            self._ballots[name] = BallotState(name, quorum)
+        else:
+            self._ballots[name].quorum = quorum
+        if not self.current_ballot:
+            self.current_ballot = name
+        self.xmpp.event('xsf_ballot_opened', name)
+
+    def close_ballot(self, name):
+        if self._ballots.pop(name, None) is None:
+            return
+        if self.current_ballot == name:
+            self.current_ballot = next(iter(self._ballots), '')
+        self.xmpp.event('xsf_ballot_closed', name)
 
     def load_ballot(self, name, quorum):
-        self.quorum = quorum
-        self.current_ballot = name
-
-        with open('%s/ballot_%s.xml' % (self.data_dir, name)) as ballot_file:
-            self._ballot_data = Ballot(xml=ET.fromstring(ballot_file.read()))
+        self.open_ballot(name, quorum)
+        self._get_state(name)
+
+    def ballot_path(self, name):
+        return '%s/ballot_%s.xml' % (self.data_dir, name)
+
+    def _get_state(self, ballot=None):
+        state = self._ballots[ballot or self.current_ballot]
+        if state.data is None:
+            state.mtime, state.data = self._compile_ballot(state.name)
+            self._load_state(state)
+        return state
+
+    def _load_state(self, state):
+        # Whatever a compiled ballot needs before its first vote, whether
+        # it was compiled on first use or by a reload.
+        if state.votes is None:
+            state.votes = self._index_sessions(state)
+        os.makedirs('%s/results/%s' % (self.data_dir, state.name), exist_ok=True)
+        if state.audit is None:
+            state.audit = self._load_audit(state.name)
+
+    def _compile_ballot(self, name):
+        path = self.ballot_path(name)
+        mtime = os.path.getmtime(path)
+        with open(path) as ballot_file:
+            return mtime, Ballot(xml=ET.fromstring(ballot_file.read()))
+
+    def reload_ballot(self, name):
+        """
+        Recompile a ballot from its file and swap it in place of the one in
+        use. If the file cannot be compiled the current ballot is kept.
+
+        Stored sessions are updated to the sections of the new ballot, so
+        voters can resume them.
+        """
+        state = self._ballots[name]
+        old = state.data
+        state.mtime, state.data = self._compile_ballot(name)
+        self._load_state(state)
+        self._migrate_sessions(state, old)
+        self.xmpp.event('xsf_ballot_reloaded', name)
+
+    def _candidate_names(self, old, new):
+        """
+        Map the candidate names of each section of an old ballot to their
+        names in a new one. Candidates are matched by JID, by position when
+        they have none and the section has as many candidates as before, or
+        else by name. Candidates left out are no longer running.
+        """
+        names = {}
+        for section in new['sections']:
+            title = section['title']
+            current = [item['name'] for item in section['items']]
+            before = old.findSection(title) if old is not None else None
+            if before is None:
+                # Nothing to match against, such as a ballot first compiled
+                # by this reload.
+                names[title] = {name: name for name in current}
+                continue
+            by_jid = {item['jid']: item['name'] for item in section['items'] if item['jid']}
+            names[title] = {}
+            for position, item in enumerate(before['items']):
+                if item['jid'] and by_jid:
+                    name = by_jid.get(item['jid'])
+                elif len(before['items']) == len(current):
+                    name = current[position]
+                else:
+                    name = item['name'] if item['name'] in current else None
+                if name is not None:
+                    names[title][item['name']] = name
+        return names
+
+    def _migrate_votes(self, state, names, votes):
+        """
+        Carry votes over to the sections and candidate names of a reloaded
+        ballot. Returns the migrated votes and the candidates dropped from
+        each section.
+        """
+        migrated = {}
+        dropped = {}
+        for section in state.data['sections']:
+            title = section['title']
+            renamed = names.get(title, {})
+            migrated[title] = {}
+            for key, value in votes.get(title, {}).items():
+                # Limit sections map seats to candidates, the others map
+                # candidates to answers.
+                name = value if section['limit'] else key
+                if name not in renamed:
+                    dropped.setdefault(title, []).append(name)
+                elif section['limit']:
+                    migrated[title][key] = renamed[name]
+                else:
+                    migrated[title][renamed[name]] = value
+        return migrated, dropped
+
+    def _migrate_sessions(self, state, old):
+        names = self._candidate_names(old, state.data)
+        for member in self.xmpp['xsf_roster'].get_members():
+            key = self._session_key(member, state.name)
+            session = self.redis.hgetall(key)
+            if not session or 'votes' not in session:
+                continue
+
+            changes = {}
+            votes, dropped = self._migrate_votes(state, names, session['votes'])
+            for title, candidates in sorted(dropped.items()):
+                log.warning('%s: dropped votes of %s in %s for %s, no longer on the ballot',
+                            state.name, member.bare, title, ', '.join(candidates))
+            fulfilled = {title: sum([1 for vote in section_votes.values() if vote == 'yes'])
+                         for title, section_votes in votes.items()}
+            if votes != session['votes']:
+                changes['votes'] = votes
+            if fulfilled != session.get('fulfilled'):
+                changes['fulfilled'] = fulfilled
+            if 'counted' in session:
+                counted, _ = self._migrate_votes(state, names, session['counted'])
+                if counted != session['counted']:
+                    changes['counted'] = counted
+            if changes:
+                self.redis.hset_many(key, changes)
+                self.xmpp.event('xsf_session_changed', member)
+        # Votes for dropped sections and candidates must not be counted.
+        state.votes = self._index_sessions(state)
+
+    def _index_sessions(self, state):
+        """
+        Build a vote index from the stored sessions of all members. The
+        ballot each voter last completed is counted, and held while they
+        are recasting, as if their votes had been cast in this process.
+        """
+        index = VoteIndex()
+        for member in self.xmpp['xsf_roster'].get_members():
+            session = self.redis.hgetall(self._session_key(member, state.name))
+            if not session:
+                continue
+            counted = session.get('counted')
+            if counted is None and session.get('status') == 'completed':
+                # Sessions completed before the counted votes were kept.
+                counted = session.get('votes', {})
+            if counted is not None:
+                self._set_session_votes(index, state, member.bare, counted)
+                index.finalize(member.bare)
+                if session.get('status') == 'completed':
+                    continue
+                index.hold(member.bare)
+            self._set_session_votes(index, state, member.bare, session.get('votes', {}))
+        return index
+
+    def _set_session_votes(self, index, state, jid, votes):
+        for section in state.data['sections']:
+            title = section['title']
+            index.set_votes(jid, title, self._section_answers(section, votes.get(title, {})))
+
+    def _section_answers(self, section, votes):
+        if section['limit']:
+            return [(name, 'yes') for name in votes.values()]
+        return list(votes.items())
+
+    def _audit_path(self, name):
+        return '%s/results/%s.audit' % (self.data_dir, name)
+
+    def _load_audit(self, name, update_index=True):
+        """
+        Rebuild the audit tree of a ballot from its result files, in the
+        order kept in the audit index. Result files missing from the index
+        are added to it, in name order, unless update_index is False.
+        """
+        results_dir = '%s/results/%s' % (self.data_dir, name)
         try:
-            os.makedirs('%s/results/%s' % (self.data_dir, name))
-        except IOError:
-            pass
-
-    def has_quorum(self):
-        return self.redis.scard('%s:voters:%s' % (self.key_prefix, self.current_ballot)) >= self.quorum
-
-    def get_ballot(self):
-        return self._ballot_data
-
-    def get_session(self, jid):
-        session = self.redis.hgetall('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare))
+            with open(self._audit_path(name)) as index:
+                order = [jid.strip() for jid in index if jid.strip()]
+        except FileNotFoundError:
+            order = []
+        known = set(order)
+        try:
+            unindexed = sorted(filename[:-4] for filename in os.listdir(results_dir)
+                               if filename.endswith('.xml') and filename[:-4] not in known)
+        except FileNotFoundError:
+            unindexed = []
+        if unindexed and update_index:
+            with open(self._audit_path(name), 'a') as index:
+                for jid in unindexed:
+                    index.write('%s\n' % jid)
+
+        audit = MerkleLog()
+        for jid in order + unindexed:
+            try:
+                with open('%s/%s.xml' % (results_dir, jid), 'rb') as result:
+                    data = result.read()
+            except FileNotFoundError:
+                log.warning('Result of %s for ballot %s is missing', jid, name)
+                data = b''
+            audit.set_leaf(jid, data)
+        return audit
+
+    def _check_ballots(self):
+        for state in list(self._ballots.values()):
+            if state.data is None:
+                continue
+            try:
+                if os.path.getmtime(self.ballot_path(state.name)) == state.mtime:
+                    continue
+                self.reload_ballot(state.name)
+                log.info('Reloaded ballot %s', state.name)
+            except (OSError, ET.ParseError) as e:
+                log.error('Could not reload ballot %s: %s', state.name, e)
+
+    def _session_key(self, jid, ballot=None):
+        return '%s:session:%s:%s' % (self.key_prefix, ballot or self.current_ballot, jid.bare)
+
+    def _voters_key(self, ballot=None):
+        return '%s:voters:%s' % (self.key_prefix, ballot or self.current_ballot)
+
+    def get_ballots(self):
+        return list(self._ballots)
+
+    def is_loaded(self, ballot=None):
+        name = ballot or self.current_ballot
+        return name in self._ballots and self._ballots[name].data is not None
+
+    def get_quorum(self, ballot=None):
+        return self._ballots[ballot or self.current_ballot].quorum
+
+    def num_voters(self, ballot=None):
+        return self.redis.scard(self._voters_key(ballot))
+
+    def has_quorum(self, ballot=None):
+        return self.num_voters(ballot) >= self.get_quorum(ballot)
+
+    def has_voted(self, jid, ballot=None):
+        return self.redis.sismember(self._voters_key(ballot), JID(jid).bare)
+
+    def get_ballot(self, ballot=None):
+        if not self._ballots:
+            return None
+        return self._get_state(ballot).data
+
+    def get_audit(self, ballot=None):
+        """
+        Return the Merkle tree over the result files of a ballot, one leaf
+        per voter holding the hash of their result file.
+
+        With shared storage, other processes add result files and index
+        entries for their own voters, so the tree is rebuilt from the index
+        and the result files on every call. Only the process that wrote a
+        result file adds it to the index.
+        """
+        state = self._get_state(ballot)
+        if self.storage == 'redis':
+            state.audit = self._load_audit(state.name, update_index=False)
+        return state.audit
+
+    def get_tally(self, ballot=None, pending=False):
+        """
+        Return per-candidate vote counts for a ballot.
+
+        Only completed ballots are counted, unless pending is set, in
+        which case votes of sessions still in progress are included.
+        """
+        if pending:
+            return self._tally_index(ballot).totals()
+        return self._tally_index(ballot).counts()
+
+    def num_counted(self, ballot=None):
+        return self._tally_index(ballot).num_final()
+
+    def _tally_index(self, ballot=None):
+        state = self._get_state(ballot)
+        if self.storage == 'redis':
+            # Other processes record votes in the shared store too, so the
+            # local index only knows part of them.
+            return self._index_sessions(state)
+        return state.votes
+
+    def _index_votes(self, jid, section, votes, ballot=None):
+        state = self._get_state(ballot)
+        answers = self._section_answers(state.data.findSection(section), votes)
+        state.votes.set_votes(jid.bare, section, answers)
+
+    def get_session(self, jid, ballot=None):
+        session = self.redis.hgetall(self._session_key(jid, ballot))
         if not session:
             session = {'status': '', 'votes': {}, 'fulfilled': {}}
         return session
 
-    def start_voting(self, jid):
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'status', 'started')
-        ballot = self.get_ballot()
+    def start_voting(self, jid, ballot=None):
+        key = self._session_key(jid, ballot)
+        state = self._get_state(ballot)
         votes = {}
         fulfilled = {}
-        for section in ballot['sections']:
+        for section in state.data['sections']:
             votes[section['title']] = {}
             fulfilled[section['title']] = 0
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'votes', votes)
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'fulfilled', fulfilled)
-        return self.get_session(jid)
-
-    def restart_voting(self, jid):
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'status', 'started')
-        return self.get_session(jid)
-
-    def end_voting(self, jid):
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'status', 'completed')
-
-        pre_quorum = self.has_quorum()
-        self.redis.sadd('%s:voters:%s' % (self.key_prefix, self.current_ballot), jid)
-        if not pre_quorum and self.has_quorum():
-            self.xmpp.event('quorum_reached')
+        self.redis.hset_many(key, {'status': 'started', 'votes': votes, 'fulfilled': fulfilled})
+        state.votes.clear(jid.bare)
+        self.xmpp.event('xsf_session_changed', jid)
+        return self.get_session(jid, ballot)
+
+    def restart_voting(self, jid, ballot=None):
+        self.redis.hset(self._session_key(jid, ballot), 'status', 'started')
+        self._get_state(ballot).votes.hold(jid.bare)
+        self.xmpp.event('xsf_session_changed', jid)
+        return self.get_session(jid, ballot)
+
+    def end_voting(self, jid, ballot=None):
+        state = self._get_state(ballot)
+        session = self.get_session(jid, ballot)
+        # The votes as counted are kept apart from the ones a recast changes.
+        self.redis.hset_many(self._session_key(jid, ballot), {'status': 'completed',
+                                                              'counted': copy.deepcopy(session['votes'])})
+        state.votes.finalize(jid.bare)
+        self.xmpp.event('xsf_session_changed', jid)
+
+        pre_quorum = self.has_quorum(ballot)
+        self.redis.sadd(self._voters_key(ballot), jid.bare)
+        if not pre_quorum and self.has_quorum(ballot):
+            self.xmpp.event('quorum_reached', state.name)
 
         # HACK: Make this just work with the old format. We will adjust this later once the tallying stuff is updated.
-        session = self.get_session(jid)
-        with open('%s/results/%s/%s.xml' % (self.data_dir, self.current_ballot, jid.bare), 'w+') as result:
-            result.write('<?xml version="1.0"?>')
-            result.write('<respondent jid="%s">' % jid.bare)
-            for section in session['votes']:
-                membervotes = session['votes'][section]
-                print(repr(membervotes))
-                if section == 'Board':
-                    yesvotes = set()
-                    for position, name in membervotes.items():
-                        yesvotes.add(name)
-                    result.write('<board>')
-                    for item in self._ballot_data.findSection(section)['items']:
-                        vote = 'yes' if item['name'] in yesvotes else 'no'
-                        result.write('<item name="%s">%s</item>' % (item['name'], vote))
-                    result.write('</board>')
-                elif section == 'Council':
-                    yesvotes = set()
-                    for position, name in membervotes.items():
-                        yesvotes.add(name)
-                    result.write('<council>')
-                    for item in self._ballot_data.findSection(section)['items']:
-                        vote = 'yes' if item['name'] in yesvotes else 'no'
-                        result.write('<item name="%s">%s</item>' % (item['name'], vote))
-                    result.write('</council>')
-                elif section == 'XSF Membership':
-                    for i, item in enumerate(self._ballot_data.findSection(section)['items']):
-                        vote = membervotes[item['name']]
-                        result.write('<!-- %s -->' % item['name'])
-                        result.write('<answer%s>%s</answer%s>' % (i, vote, i))
-                else:
-                    for i, item in enumerate(self._ballot_data.findSection(section)['items']):
-                        vote = membervotes[item['name']]
-                        result.write('<!-- %s -->' % item['name'])
-                        result.write('<answer%s>%s</answer%s>' % (i, vote, i))
-
-            result.write('</respondent>')
-
-    def record_vote(self, jid, section, item, answer):
-        session = self.get_session(jid)
+        result = io.StringIO()
+        result.write('<?xml version="1.0"?>')
+        result.write('<respondent jid="%s">' % jid.bare)
+        for section in session['votes']:
+            membervotes = session['votes'][section]
+            log.debug('%s: %s votes for %s: %r', state.name, jid.bare, section, membervotes)
+            if section == 'Board':
+                yesvotes = set()
+                for position, name in membervotes.items():
+                    yesvotes.add(name)
+                result.write('<board>')
+                for item in state.data.findSection(section)['items']:
+                    vote = 'yes' if item['name'] in yesvotes else 'no'
+                    result.write('<item name="%s">%s</item>' % (item['name'], vote))
+                result.write('</board>')
+            elif section == 'Council':
+                yesvotes = set()
+                for position, name in membervotes.items():
+                    yesvotes.add(name)
+                result.write('<council>')
+                for item in state.data.findSection(section)['items']:
+                    vote = 'yes' if item['name'] in yesvotes else 'no'
+                    result.write('<item name="%s">%s</item>' % (item['name'], vote))
+                result.write('</council>')
+            elif section == 'XSF Membership':
+                for i, item in enumerate(state.data.findSection(section)['items']):
+                    vote = membervotes[item['name']]
+                    result.write('<!-- %s -->' % item['name'])
+                    result.write('<answer%s>%s</answer%s>' % (i, vote, i))
+            else:
+                for i, item in enumerate(state.data.findSection(section)['items']):
+                    vote = membervotes[item['name']]
+                    result.write('<!-- %s -->' % item['name'])
+                    result.write('<answer%s>%s</answer%s>' % (i, vote, i))
+
+        result.write('</respondent>')
+
+        content = result.getvalue().encode('utf-8')
+        with open('%s/results/%s/%s.xml' % (self.data_dir, state.name, jid.bare), 'wb') as result_file:
+            result_file.write(content)
+        if state.audit.set_leaf(jid.bare, content):
+            with open(self._audit_path(state.name), 'a') as index:
+                index.write('%s\n' % jid.bare)
+
+    def record_vote(self, jid, section, item, answer, ballot=None):
+        session = self.get_session(jid, ballot)
         votes = session['votes']
         votes[section][item] = answer
         fulfilled = session['fulfilled']
         fulfilled[section] = sum([1 for (name, vote) in votes[section].items() if vote == 'yes'])
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'votes', votes)
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'fulfilled', fulfilled)
-        return self.get_session(jid)
+        self.redis.hset_many(self._session_key(jid, ballot), {'votes': votes, 'fulfilled': fulfilled})
+        self._index_votes(jid, section, votes[section], ballot)
+        self.xmpp.event('xsf_session_changed', jid)
+        return session
 
-    def abstain_vote(self, jid, section, item):
-        session = self.get_session(jid)
+    def abstain_vote(self, jid, section, item, ballot=None):
+        session = self.get_session(jid, ballot)
         votes = session['votes']
         if item in votes[section]:
             del votes[section][item]
         fulfilled = session['fulfilled']
         fulfilled[section] = sum([1 for (name, vote) in votes[section].items() if vote == 'yes'])
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'votes', votes)
-        self.redis.hset('%s:session:%s:%s' % (self.key_prefix, self.current_ballot, jid.bare), 'fulfilled', fulfilled)
-        return self.get_session(jid)
+        self.redis.hset_many(self._session_key(jid, ballot), {'votes': votes, 'fulfilled': fulfilled})
+        self._index_votes(jid, section, votes[section], ballot)
+        self.xmpp.event('xsf_session_changed', jid)
+        return session
 
 
 register_plugin(XSFVoting)
@@ -16,7 +16,9 @@ class XSFRoster(BasePlugin):
     }
 
     def plugin_init(self):
+        self._command_items = None
         self._load_data()
+        self.xmpp.add_event_handler('xsf_commands_changed', self._commands_changed)
 
     def _load_data(self):
         _members = set()
@@ -55,36 +57,61 @@ class XSFRoster(BasePlugin):
             name='Remove XSF Member JID',
             handler=self._remove_jid)
 
-        def filtered_items(jid, node, ifrom, data=None):
-            try:
-                result = self.xmpp['xep_0030'].static.get_items(jid, node, ifrom, data)
-                log.debug(result)
-
-                if ifrom.bare not in self._admins:
-                    items = result['substanzas']
-                    for item in items:
-                        if 'admin:' in item['node']:
-                            result.xml.remove(item.xml)
-            except Exception as e:
-                log.debug(e)
-
-            return result
-
-        self.xmpp['xep_0030'].api.register(filtered_items, 'get_items',
+        self._command_items = None
+        self.xmpp['xep_0030'].api.register(self._get_command_items, 'get_items',
                                            jid=self.xmpp.boundjid,
                                            node=self.xmpp['xep_0050'].stanza.Command.namespace)
 
+    def _commands_changed(self, event=None):
+        self._command_items = None
+
+    def _build_command_items(self):
+        """
+        Split the registered ad-hoc commands into the lists shown to admins
+        and to members, so disco#items requests do not have to filter them.
+        """
+        disco = self.xmpp['xep_0030']
+        node = self.xmpp['xep_0050'].stanza.Command.namespace
+        items = disco.static.get_items(self.xmpp.boundjid, node, None, None)
+
+        admin_items = disco.stanza.DiscoItems()
+        member_items = disco.stanza.DiscoItems()
+        admin_items['node'] = member_items['node'] = node
+        # Walk the item elements rather than items['items'], which is a set,
+        # so commands are listed in the order they were registered.
+        for item in items['substanzas']:
+            admin_items.add_item(item['jid'], item['node'], item['name'])
+            if 'admin:' not in item['node']:
+                member_items.add_item(item['jid'], item['node'], item['name'])
+
+        self._command_items = {'admin': admin_items, 'member': member_items}
+        return self._command_items
+
+    def _get_command_items(self, jid, node, ifrom, data=None):
+        # The returned stanzas are shared between requests and must not be
+        # modified; they are replaced whenever the command list changes.
+        command_items = self._command_items or self._build_command_items()
+        if ifrom is not None and self.is_admin(ifrom):
+            return command_items['admin']
+        return command_items['member']
+
     def get_members(self):
         return self._members
 
     def is_member(self, jid):
         return JID(jid).bare in self._members
 
+    def is_admin(self, jid):
+        return JID(jid).bare in self._admins
+
+    def reload(self):
+        self._load_data()
+
     def _reload(self, iq, session):
         if iq['from'].bare not in self._admins:
             raise XMPPError('forbidden')
 
-        self._load_data()
+        self.reload()
 
         session['has_next'] = False
         session['payload'] = None